@@ -0,0 +1,184 @@
+"""
+This module computes sales and inventory analytics from the events recorded by
+the Marketplace's EventLog, with vectorized NumPy operations only.
+
+Usage: python3 analytics.py <events.npz>
+"""
+
+import sys
+
+import numpy as np
+
+from tema.event_log import EventLog
+
+OP = {op: code for code, op in enumerate(EventLog.OPS)}
+
+
+def duration(events):
+    """
+    Returns the time span of the events, in seconds.
+    """
+    if len(events) == 0:
+        return 0.0
+
+    return float(events['time'].max() - events['time'].min())
+
+
+def throughput(events, key, op='order', minlength=0):
+    """
+    Returns the number of `op` events per second, for every value of `key`.
+
+    :type key: String
+    :param key: 'producer' or 'product'
+
+    :type minlength: Int
+    :param minlength: the minimum length of the result, e.g. the number of producers
+
+    :rtype: numpy.ndarray
+    :return: the throughput, indexed by the producer / product ID
+    """
+    selected = events[key][events['op'] == OP[op]]
+    counts = np.bincount(selected[selected >= 0], minlength=minlength)
+
+    return counts / max(duration(events), 1e-9)
+
+
+def fill_rate(events, minlength=0):
+    """
+    Returns, for every producer, the fraction of its published units that were ordered.
+
+    :type minlength: Int
+    :param minlength: the minimum length of the result, e.g. the number of producers
+
+    :rtype: numpy.ndarray
+    :return: the fill rate, indexed by the producer ID
+    """
+    producers = events['producer']
+    published = np.bincount(producers[events['op'] == OP['publish']], minlength=minlength)
+    ordered = np.bincount(producers[events['op'] == OP['order']], minlength=len(published))
+
+    return np.divide(ordered[:len(published)], published,
+                     out=np.zeros(len(published)), where=published > 0)
+
+
+def backlog(events, num_points=100, product=None):
+    """
+    Returns the number of units in stock over time, sampled on a regular grid.
+    Publishing and removing from a cart add a unit, adding to a cart takes one.
+
+    :type product: Int
+    :param product: only count the units of this product ID
+
+    :rtype: Tuple
+    :return: (times, units in stock)
+    """
+    if product is not None:
+        events = events[events['product'] == product]
+
+    delta = np.zeros(len(events), dtype=np.int64)
+    delta[np.isin(events['op'], (OP['publish'], OP['remove']))] = 1
+    delta[events['op'] == OP['add']] = -1
+
+    order = np.argsort(events['time'], kind='stable')
+    times = events['time'][order]
+    stock = np.cumsum(delta[order])
+
+    if len(times) == 0:
+        return np.zeros(0), np.zeros(0, dtype=np.int64)
+    grid = np.linspace(times[0], times[-1], num_points)
+    index = np.searchsorted(times, grid, side='right') - 1
+
+    return grid, stock[np.maximum(index, 0)]
+
+
+def wait_latencies(events):
+    """
+    Returns the time it took to acquire every unit added to a cart: from the first
+    failed attempt after the previous unit of the same product and cart (or from
+    the successful attempt itself, if none failed) to the successful attempt.
+
+    :rtype: Tuple
+    :return: (product IDs, latencies in seconds)
+    """
+    adds = events[np.isin(events['op'], (OP['add'], OP['add_failed']))]
+    order = np.lexsort((adds['time'], adds['product'], adds['cart']))
+    adds = adds[order]
+
+    index = np.arange(len(adds))
+    success = adds['op'] == OP['add']
+    group_start = np.ones(len(adds), dtype=bool)
+    group_start[1:] = (adds['cart'][1:] != adds['cart'][:-1]) \
+        | (adds['product'][1:] != adds['product'][:-1])
+
+    # A wait starts at the start of a group or right after a successful attempt
+    reset = np.zeros(len(adds), dtype=np.int64)
+    reset[1:] = np.where(success[:-1], index[1:], 0)
+    reset = np.maximum(reset, np.where(group_start, index, 0))
+    start = np.maximum.accumulate(reset)
+
+    latencies = adds['time'][success] - adds['time'][start[success]]
+
+    return adds['product'][success], latencies
+
+
+def percentiles(keys, values, quantiles=(0.5, 0.9, 0.99)):
+    """
+    Returns the given quantiles of `values`, for every key.
+
+    :rtype: numpy.ndarray
+    :return: a (number of keys, number of quantiles) array, NaN for keys without values
+    """
+    order = np.lexsort((values, keys))
+    keys = keys[order]
+    values = values[order]
+
+    counts = np.bincount(keys) if len(keys) else np.zeros(0, dtype=np.int64)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    positions = starts[:, None] + np.floor(np.outer(np.maximum(counts - 1, 0),
+                                                    quantiles)).astype(np.int64)
+
+    result = np.full((len(counts), len(quantiles)), np.nan)
+    has_values = counts > 0
+    result[has_values] = values[positions[has_values]]
+
+    return result
+
+
+def main():
+    """
+    Prints the analytics of the events file given as the first argument.
+    """
+    if len(sys.argv) != 2:
+        print("Usage: analytics.py events_filepath")
+        return
+
+    data = np.load(sys.argv[1])
+    events = data['events']
+    products = data['products']
+
+    print(f'{len(events)} events over {duration(events):.3f}s')
+
+    # Both arrays have an entry for every producer, even without orders or publications
+    num_producers = int(events['producer'].max()) + 1 if len(events) else 0
+    print('\nPer producer: orders/s, fill rate')
+    for producer_id, (rate, fill) in enumerate(zip(throughput(events, 'producer',
+                                                              minlength=num_producers),
+                                                   fill_rate(events, minlength=num_producers))):
+        print(f'    {producer_id:>4}{rate:>10.2f}{fill:>8.0%}')
+
+    print('\nPer product: orders/s, time to acquire p50 / p90 / p99 (ms)')
+    product_ids, latencies = wait_latencies(events)
+    latency = percentiles(product_ids, latencies)
+    for product_id, rate in enumerate(throughput(events, 'product', minlength=len(products))):
+        quantiles = latency[product_id] * 1000 if product_id < len(latency) else [np.nan] * 3
+        print(f'    {products[product_id]}\n    {rate:>14.2f}'
+              + ''.join(f'{value:>10.1f}' for value in quantiles))
+
+    times, stock = backlog(events, num_points=10)
+    print('\nUnits in stock over time')
+    for time, units in zip(times, stock):
+        print(f'    {time:>8.3f}s{units:>8}')
+
+
+if __name__ == '__main__':
+    main()
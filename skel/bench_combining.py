@@ -0,0 +1,56 @@
+"""
+This module benchmarks the flat-combining Marketplace against plain locking,
+for an increasing skew of the product popularity, with the workload of the stress test.
+
+Usage: python3 bench_combining.py [--skew 1 2 4] [--producers P] [--consumers C] [--ops N]
+"""
+
+import sys
+from argparse import ArgumentParser
+
+from stress import run_stress, check_invariants
+from tema.logger import Logger
+from tema.marketplace import Marketplace
+
+
+def main():
+    """
+    Prints the throughput of every configuration and checks its invariants.
+    """
+    parser = ArgumentParser()
+    parser.add_argument('--skew', type=float, nargs='+', default=[1, 2, 4],
+                        help="skews of the product popularity to benchmark")
+    parser.add_argument('--producers', type=int, default=16, help="number of producer threads")
+    parser.add_argument('--consumers', type=int, default=64, help="number of consumer threads")
+    parser.add_argument('--products', type=int, default=10, help="number of distinct products")
+    parser.add_argument('--queue-size', type=int, default=8, help="queue size per producer")
+    parser.add_argument('--ops', type=int, default=1000, help="operations per thread")
+    args = parser.parse_args()
+
+    Logger.disable()
+    # Switch threads as often as possible, like the stress test: with the default switch
+    # interval, the stock lock is almost never contended and the combiner never engages
+    sys.setswitchinterval(1e-6)
+
+    print(f'{"configuration":<24}{"ops/s":>12}{"batches":>10}{"combined":>10}'
+          f'{"share":>8}{"violations":>12}')
+    for skew in args.skew:
+        for name, combining in (('locking', False), ('combining', True)):
+            marketplace = Marketplace(args.queue_size, combining=combining)
+            producers, consumers, elapsed = run_stress(marketplace, args.producers,
+                                                       args.consumers, args.products,
+                                                       args.ops, skew=skew)
+            total = sum(len(worker.history) for worker in producers + consumers)
+            violations = check_invariants(marketplace, producers, consumers)
+            # The share of the reservations and returns that went through the combiner
+            combiner = marketplace.combiner
+            batches = combiner.batches if combiner else 0
+            combined = combiner.combined if combiner else 0
+            calls = sum(1 for consumer in consumers for op, *_ in consumer.history
+                        if op in ('add_to_cart', 'remove_from_cart'))
+            print(f'{f"{name} skew={skew:g}":<24}{total / elapsed:>12.0f}{batches:>10}'
+                  f'{combined:>10}{combined / max(calls, 1):>8.1%}{len(violations):>12}')
+
+
+if __name__ == '__main__':
+    main()
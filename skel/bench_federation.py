@@ -0,0 +1,49 @@
+"""
+This module benchmarks the MarketplaceFederation against a single Marketplace,
+for an increasing number of shards, with the workload of the stress test.
+
+Usage: python3 bench_federation.py [--shards 1 2 4 8] [--producers P] [--consumers C] [--ops N]
+"""
+
+from argparse import ArgumentParser
+
+from stress import run_stress, check_invariants
+from tema.federation import MarketplaceFederation
+from tema.logger import Logger
+from tema.marketplace import Marketplace
+
+
+def main():
+    """
+    Prints the throughput of every configuration and checks its invariants.
+    """
+    parser = ArgumentParser()
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="numbers of shards to benchmark")
+    parser.add_argument('--producers', type=int, default=16, help="number of producer threads")
+    parser.add_argument('--consumers', type=int, default=64, help="number of consumer threads")
+    parser.add_argument('--products', type=int, default=10, help="number of distinct products")
+    parser.add_argument('--queue-size', type=int, default=8, help="queue size per producer")
+    parser.add_argument('--ops', type=int, default=1000, help="operations per thread")
+    args = parser.parse_args()
+
+    Logger.disable()
+
+    configurations = [('Marketplace', lambda: Marketplace(args.queue_size))]
+    configurations += [(f'Federation K={num_shards}',
+                        lambda num_shards=num_shards: MarketplaceFederation(args.queue_size,
+                                                                            num_shards))
+                       for num_shards in args.shards]
+
+    print(f'{"configuration":<18}{"ops/s":>12}{"violations":>12}')
+    for name, build in configurations:
+        marketplace = build()
+        producers, consumers, elapsed = run_stress(marketplace, args.producers, args.consumers,
+                                                   args.products, args.ops)
+        total = sum(len(worker.history) for worker in producers + consumers)
+        violations = check_invariants(marketplace, producers, consumers)
+        print(f'{name:<18}{total / elapsed:>12.0f}{len(violations):>12}')
+
+
+if __name__ == '__main__':
+    main()
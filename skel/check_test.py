@@ -1,30 +1,54 @@
 """
 This module checks that the homework's solution output is correct
 
+Both the output and the reference can be receipts (`consumer product_id count`
+lines, see tema/receipt.py) or legacy `consumer bought Product(...)` lines.
+Receipts are compared as counts, without sorting or diffing a line per unit;
+a receipt output is expanded with the products of the test's scenario to be
+compared with a legacy reference.
+
 Computer Systems Architecture Course
 Assignment 1
 March 2021
 """
+import os
 import subprocess
 import sys
 
+from tema.receipt import is_receipt, parse_receipts, load_products, expand
+
 
 def main():
-    if len(sys.argv) != 4:
-        print("Invalid number of arguments\nUsage: check_test.py testname output_filepath ref_filepath")
+    args = [arg for arg in sys.argv[1:] if arg != '--expand']
+    if len(args) != 3:
+        print("Invalid number of arguments\n"
+              "Usage: check_test.py [--expand] testname output_filepath ref_filepath")
         return
 
-    testname = sys.argv[1]
-    output_filename = sys.argv[2]
-    ref_filename = sys.argv[3]
-    # load the lines from the output file and sort them
+    testname, output_filename, ref_filename = args
+    # `--expand` writes receipts back in the legacy format, to `output_filepath.sorted`
+    expand_output = '--expand' in sys.argv
+
     with open(output_filename) as output_file:
-        output_lines = output_file.read()
+        output = output_file.read()
+    with open(ref_filename, encoding='utf-8') as ref_file:
+        ref = ref_file.read()
 
-    output_lines = output_lines.split(")")  # sometimes there is no new line between consumer outputs
-    output_lines = [line.strip() + ")" for line in output_lines if len(line.strip()) > 0]
+    if is_receipt(output) and is_receipt(ref) and not expand_output:
+        passed = parse_receipts(output) == parse_receipts(ref)
+        print(f"Test {testname}" + ":\t\t" + ("PASSED" if passed else "FAILED"))
+        return
 
-    output_lines.sort()
+    # the products of the receipts are described in the test's scenario (tests/{test_name}.in)
+    scenario = os.path.join(os.path.dirname(ref_filename), f"{testname.zfill(2)}.in")
+
+    if is_receipt(output):
+        output_lines = expand(parse_receipts(output), load_products(scenario))
+    else:
+        # load the lines from the output file and sort them
+        output_lines = output.split(")")  # sometimes there is no new line between consumer outputs
+        output_lines = [line.strip() + ")" for line in output_lines if len(line.strip()) > 0]
+        output_lines.sort()
 
     sorted_output_filename = output_filename + ".sorted"
 
@@ -33,10 +57,15 @@ def main():
         for line in output_lines:
             print(line, file=sorted_output_file)
 
-    command = subprocess.Popen(["diff", sorted_output_filename, ref_filename], stdout=subprocess.PIPE)
-    out, err = command.communicate()
+    if is_receipt(ref):
+        passed = output_lines == expand(parse_receipts(ref), load_products(scenario))
+    else:
+        command = subprocess.Popen(["diff", sorted_output_filename, ref_filename],
+                                   stdout=subprocess.PIPE)
+        out, err = command.communicate()
+        passed = len(out) == 0
 
-    if len(out) == 0:
+    if passed:
         print(f"Test {testname}" + ":\t\t" + "PASSED")
     else:
         print(f"Test {testname}" + ":\t\t" + "FAILED")
@@ -0,0 +1,336 @@
+"""
+This module analyzes a scenario offline, without running it: it compares the supply
+of every product with its demand, bounds the occupancy of the producers' queues under
+`queue_size_per_producer` and finds the products that deadlock. It also computes the
+expected output as receipts. Every step is a vectorized NumPy operation over flat
+arrays of the scenario's operations and schedules.
+
+Usage: python3 feasibility.py <scenario.in|scenario.json> [--expected FILE]
+
+The producers cycle through their lists forever, so with adversarial timings (the
+consumers never buy) every queue fills up: the worst case is only informative up to
+the point where a producer first needs a slot for a product. So the analysis uses two
+bounds that hold for every timing:
+    - the worst-case occupancy of a producer's queue when it first publishes a product:
+      the units it publishes before it, if none of them is bought yet. If it reaches
+      the queue size for all the producers of a product, the product may deadlock
+    - the maximum supply of a product: the units of a product that leave the queues
+      can't exceed the units the carts reserve, so after k cycles a producer has at least
+      sum((k * units per cycle - units reserved)+) units in its queue. It can't publish
+      beyond the first cycle that fills its queue that way. If all the producers of a
+      product can't supply the units the carts keep, the product deadlocks for sure
+The 'add_any' operations count in the units reserved of all their alternatives. Their
+outcome depends on the run, so they are not part of the units kept or the expected output.
+"""
+
+import sys
+from argparse import ArgumentParser
+from json import loads
+
+import numpy as np
+
+from tema.receipt import format_receipt
+
+ADD = 'add'
+REMOVE = 'remove'
+
+
+class Scenario:
+    """
+    Flat arrays of a scenario's operations and schedules, with the products as indexes.
+    """
+
+    def __init__(self, market_config):
+        """
+        Constructor
+
+        :type market_config: Dict
+        :param market_config: the scenario, as it is found in the `.in` or `.json` files
+        """
+        self.queue_size_per_producer = market_config['marketplace']['queue_size_per_producer']
+        self.product_ids = list(market_config['products'])
+        index = {product_id: i for i, product_id in enumerate(self.product_ids)}
+        self.producer_names = [producer['name'] for producer in market_config['producers']]
+        self.consumer_names = [consumer['name'] for consumer in market_config['consumers']]
+
+        # One row for every (producer, product) step of the producers' lists, in their order
+        schedules = [(producer, index[product_id], quantity, wait_time)
+                     for producer, config in enumerate(market_config['producers'])
+                     for product_id, quantity, wait_time in config['products']]
+        schedules = np.array(schedules, dtype=float).reshape(-1, 4)
+        self.schedule_producer = schedules[:, 0].astype(np.int64)
+        self.schedule_product = schedules[:, 1].astype(np.int64)
+        self.schedule_quantity = schedules[:, 2]
+        self.schedule_wait = schedules[:, 3]
+
+        # One row for every operation of every cart. The `.json` files describe the carts
+        # as {'ops': [...], 'expected_cart': {...}}. The 'add_any' operations are flexible:
+        # they get one row for every alternative, apart from the other operations
+        ops = []
+        flexible = []
+        cart = 0
+        self.flexible_ops = 0
+        for consumer, config in enumerate(market_config['consumers']):
+            for operations in config['carts']:
+                if isinstance(operations, dict):
+                    operations = operations['ops']
+                for operation in operations:
+                    if 'product' not in operation:
+                        self.flexible_ops += 1
+                        flexible += [(index[product_id], operation['quantity'])
+                                     for product_id in operation['products']]
+                        continue
+                    sign = 1 if operation['type'] == ADD else -1
+                    ops.append((consumer, cart, index[operation['product']],
+                                sign * operation['quantity']))
+                cart += 1
+        ops = np.array(ops, dtype=np.int64).reshape(-1, 4)
+        self.op_consumer, self.op_cart, self.op_product, self.op_quantity = ops.T
+        flexible = np.array(flexible, dtype=np.int64).reshape(-1, 2)
+        self.flexible_product, self.flexible_quantity = flexible.T
+
+    @property
+    def num_products(self):
+        """
+        Returns the number of products.
+        """
+        return len(self.product_ids)
+
+    @property
+    def num_producers(self):
+        """
+        Returns the number of producers.
+        """
+        return len(self.producer_names)
+
+
+def load_scenario(filename):
+    """
+    Loads a `.in` or `.json` scenario.
+    """
+    with open(filename, encoding='utf-8') as input_file:
+        return Scenario(loads(input_file.read()))
+
+
+def expected_counts(scenario):
+    """
+    Returns the number of units of every product that every consumer buys,
+    if every cart completes: every cart keeps the net quantity of its products.
+    The 'add_any' operations are left out, their outcome depends on the run.
+
+    :rtype: Tuple
+    :return: (consumers, products, counts) arrays, sorted by consumer and product
+    """
+    num_products = scenario.num_products
+    # Net quantity of every (cart, product)
+    keys, inverse = np.unique(scenario.op_cart * num_products + scenario.op_product,
+                              return_inverse=True)
+    kept = np.maximum(np.bincount(inverse, weights=scenario.op_quantity), 0)
+
+    # The carts of a consumer are bought by the consumer
+    cart_consumer = np.zeros(scenario.op_cart.max() + 1 if len(scenario.op_cart) else 0,
+                             dtype=np.int64)
+    cart_consumer[scenario.op_cart] = scenario.op_consumer
+    consumer_keys = cart_consumer[keys // num_products] * num_products + keys % num_products
+
+    keys, inverse = np.unique(consumer_keys, return_inverse=True)
+    counts = np.bincount(inverse, weights=kept).astype(np.int64)
+    bought = counts > 0
+
+    return keys[bought] // num_products, keys[bought] % num_products, counts[bought]
+
+
+def supply_and_demand(scenario):
+    """
+    Returns the supply and the demand of every product.
+
+    :rtype: Dict
+    :return: arrays indexed by the product index:
+        - 'reserved': the units the carts add, including the ones they remove later
+          and the alternatives of the 'add_any' operations
+        - 'kept': the units the carts keep
+        - 'rate': the units published per second, by all the producers
+        - 'cycle_units': the units published per cycle, by every producer (producers x products)
+        - 'met': the number of seconds until the units kept can be supplied, at best
+    """
+    num_products = scenario.num_products
+    adds = scenario.op_quantity > 0
+    reserved = np.bincount(scenario.op_product[adds], weights=scenario.op_quantity[adds],
+                           minlength=num_products)
+    reserved += np.bincount(scenario.flexible_product, weights=scenario.flexible_quantity,
+                            minlength=num_products)
+    _, products, counts = expected_counts(scenario)
+    kept = np.bincount(products, weights=counts, minlength=num_products)
+
+    # A producer goes through its list once per cycle
+    cycle_units = np.zeros((scenario.num_producers, num_products))
+    np.add.at(cycle_units, (scenario.schedule_producer, scenario.schedule_product),
+              scenario.schedule_quantity)
+    cycle = np.bincount(scenario.schedule_producer, weights=scenario.schedule_wait,
+                        minlength=scenario.num_producers)
+    rate = (cycle_units / np.maximum(cycle, 1e-3)[:, None]).sum(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        met = np.where(kept > 0, kept / rate, 0.0)
+
+    return {'reserved': reserved, 'kept': kept, 'rate': rate, 'cycle_units': cycle_units,
+            'met': met}
+
+
+def worst_occupancy(scenario):
+    """
+    Returns the worst-case occupancy of every producer's queue when it first publishes
+    every product: the units it publishes before it in its list, if none of them is bought.
+
+    :rtype: Array
+    :return: (producers x products) occupancies, capped to the queue size,
+        inf for the products a producer doesn't publish
+    """
+    # Units a producer publishes before every step of its list (the lists are contiguous)
+    before = np.cumsum(scenario.schedule_quantity) - scenario.schedule_quantity
+    producers, first_steps = np.unique(scenario.schedule_producer, return_index=True)
+    starts = np.zeros(scenario.num_producers)
+    starts[producers] = before[first_steps]
+    before -= starts[scenario.schedule_producer]
+
+    occupancy = np.full((scenario.num_producers, scenario.num_products), np.inf)
+    np.minimum.at(occupancy, (scenario.schedule_producer, scenario.schedule_product),
+                  np.minimum(before, scenario.queue_size_per_producer))
+
+    return occupancy
+
+
+def max_cycles(scenario, supply):
+    """
+    Returns the maximum number of cycles every producer can start: the first cycle k
+    after which its queue holds at least sum((k * units per cycle - units reserved)+) >=
+    `queue_size_per_producer` units that no cart can take out. Found by a bisection
+    of all the producers at once.
+
+    :rtype: Array
+    :return: the maximum number of cycles of every producer (inf if it publishes nothing)
+    """
+    cycle_units = supply['cycle_units']
+    reserved = supply['reserved']
+    queue_size = scenario.queue_size_per_producer
+    total = cycle_units.sum(axis=1)
+
+    def stuck(cycles):
+        return np.maximum(cycles[:, None] * cycle_units - reserved, 0).sum(axis=1) >= queue_size
+
+    # stuck(high) holds for every producer that publishes anything
+    publishes = total > 0
+    low = np.zeros(scenario.num_producers)
+    high = np.where(publishes, np.ceil((queue_size + reserved.sum()) / np.maximum(total, 1)), 1)
+    while np.any(high - low > 1):
+        middle = np.floor((low + high) / 2)
+        is_stuck = stuck(middle)
+        high = np.where(is_stuck, middle, high)
+        low = np.where(is_stuck, low, middle)
+
+    return np.where(publishes, high, np.inf)
+
+
+def deadlocks(scenario, supply, cycles, occupancy):
+    """
+    Finds the products that deadlock for sure and the ones that may deadlock.
+
+    :rtype: Tuple
+    :return: (certain, possible):
+        - certain: (product, maximum supply) of the products whose maximum supply is less
+          than the units the carts keep
+        - possible: the products whose producers are all full when they first publish them,
+          in the worst case
+    """
+    cycle_units = supply['cycle_units']
+    kept = supply['kept']
+    publishes = cycle_units > 0
+    # A producer that publishes nothing has infinite cycles, but no units
+    max_supply = np.where(publishes, cycles[:, None] * cycle_units, 0).sum(axis=0)
+
+    certain = np.flatnonzero((max_supply < kept) & publishes.any(axis=0))
+    full = (occupancy >= scenario.queue_size_per_producer) | ~publishes
+    possible = np.flatnonzero(((kept > 0) | (supply['reserved'] > 0)) & full.all(axis=0)
+                              & publishes.any(axis=0))
+
+    return [(product, max_supply[product]) for product in certain], \
+        [product for product in possible if product not in certain]
+
+
+def write_counts(scenario, counts, stream):
+    """
+    Writes count aggregates as receipts, one `consumer product_id count` line each.
+    """
+    for consumer, product, count in zip(*counts):
+        print(format_receipt(scenario.consumer_names[consumer], scenario.product_ids[product],
+                             count), file=stream)
+
+
+def report(scenario, stream=sys.stdout):
+    """
+    Prints the feasibility of the scenario.
+
+    :rtype: Boolean
+    :return: True unless the scenario is infeasible or deadlocks for sure
+    """
+    supply = supply_and_demand(scenario)
+    occupancy = worst_occupancy(scenario)
+    cycles = max_cycles(scenario, supply)
+    certain, possible = deadlocks(scenario, supply, cycles, occupancy)
+    ids = scenario.product_ids
+
+    print(f'{"product":<10}{"reserved":>10}{"kept":>10}{"supply/s":>12}{"met after":>12}',
+          file=stream)
+    for product, product_id in enumerate(ids):
+        print(f'{product_id:<10}{supply["reserved"][product]:>10.0f}'
+              f'{supply["kept"][product]:>10.0f}{supply["rate"][product]:>12.2f}'
+              f'{supply["met"][product]:>11.2f}s', file=stream)
+
+    print(f'\n{"producer":<10}{"worst occupancy":>17}{"max cycles":>12}  '
+          f'(queue size {scenario.queue_size_per_producer})', file=stream)
+    published = np.where(np.isfinite(occupancy), occupancy, 0)
+    for producer, name in enumerate(scenario.producer_names):
+        print(f'{name:<10}{published[producer].max(initial=0):>17.0f}{cycles[producer]:>12.0f}',
+              file=stream)
+
+    unsupplied = np.flatnonzero((supply['kept'] > 0) & (supply['rate'] == 0))
+    for product in unsupplied:
+        print(f'INFEASIBLE: {ids[product]} is bought but never produced', file=stream)
+    for product, max_supply in certain:
+        print(f'DEADLOCK: at most {max_supply:.0f} units of {ids[product]} can be supplied, '
+              f'the carts keep {supply["kept"][product]:.0f}', file=stream)
+    for product in possible:
+        print(f'WARNING: {ids[product]} may deadlock, its producers may be full '
+              f'before they first publish it', file=stream)
+    if scenario.flexible_ops:
+        print(f'{scenario.flexible_ops} add_any operations only count as reserved units',
+              file=stream)
+
+    return not len(unsupplied) and not certain
+
+
+def main():
+    """
+    Analyzes the scenario given as argument and exits with 1 if it's not feasible.
+    """
+    parser = ArgumentParser()
+    parser.add_argument('scenario', help="the scenario, as a .in or .json file")
+    parser.add_argument('--expected', metavar='FILE',
+                        help="write the expected output, as receipts")
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario)
+    if args.expected and scenario.flexible_ops:
+        parser.error("the expected output of the add_any operations depends on the run")
+    feasible = report(scenario)
+
+    if args.expected:
+        with open(args.expected, 'w', encoding='utf-8') as output_file:
+            write_counts(scenario, expected_counts(scenario), output_file)
+
+    if not feasible:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
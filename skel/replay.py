@@ -0,0 +1,205 @@
+"""
+This module replays a trace recorded with `test.py --record` against a Marketplace
+implementation, keeping the order of the calls of every producer and every consumer,
+and compares the throughput and the latencies of the replay with the recorded ones.
+
+Usage: python3 replay.py <trace> [--speed N] [--workers W] [--impl module:Class] [--log]
+"""
+
+import sys
+from argparse import ArgumentParser
+from collections import defaultdict
+from importlib import import_module
+from time import perf_counter
+from types import SimpleNamespace
+
+from tema.consumer_pool import ConsumerPool
+from tema.logger import Logger
+from tema.recorder import read_trace
+
+ID_POLL_INTERVAL = 0.001 # Seconds between two checks for an id created by another stream
+ID_TIMEOUT = 10.0 # Seconds after which a missing id is used as recorded
+
+
+class IdMap:
+    """
+    Maps the producer and cart ids of the trace to the ones of the replay.
+    Getting and setting an entry of the dict are atomic, so it takes no lock.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.ids = {} # {(kind, recorded id): replayed id}
+
+    def add(self, kind, recorded_id, replayed_id):
+        """
+        Records the replayed id of a recorded id.
+        """
+        self.ids[(kind, recorded_id)] = replayed_id
+
+    def has(self, kind, recorded_id):
+        """
+        Returns True if the replayed id of a recorded id is created.
+        """
+        return (kind, recorded_id) in self.ids
+
+    def get(self, kind, recorded_id):
+        """
+        Returns the replayed id of a recorded id (the recorded id if it's not created).
+        """
+        return self.ids.get((kind, recorded_id), recorded_id)
+
+
+def needed_id(call):
+    """
+    Returns the (kind, recorded id) that a call uses, or None if it creates its id.
+    """
+    method, _, _, _, id_, _, _ = call
+    if method in ('register_producer', 'new_cart'):
+        return None
+
+    return ('producer' if method == 'publish' else 'cart', id_)
+
+
+def replay_call(marketplace, ids, call):
+    """
+    Replays a call and returns its encoded result, as the recorder encodes it.
+    """
+    method, _, _, _, id_, recorded_result, products = call
+    # The recorded result of these calls is the recorded id they created
+    if method == 'register_producer':
+        producer_id = marketplace.register_producer()
+        ids.add('producer', recorded_result, producer_id)
+        return int(producer_id)
+    if method == 'new_cart':
+        cart_id = marketplace.new_cart()
+        ids.add('cart', recorded_result, cart_id)
+        return cart_id
+    if method == 'publish':
+        return int(bool(marketplace.publish(ids.get('producer', id_), products[0])))
+    if method == 'add_to_cart':
+        return int(bool(marketplace.add_to_cart(ids.get('cart', id_), products[0])))
+    if method == 'add_any_to_cart':
+        added = marketplace.add_any_to_cart(ids.get('cart', id_), products)
+        return products.index(added) if added else -1
+    if method == 'remove_from_cart':
+        return int(bool(marketplace.remove_from_cart(ids.get('cart', id_), products[0])))
+
+    ordered = marketplace.place_order(ids.get('cart', id_))
+    return len(ordered) if ordered else 0
+
+
+def replay(marketplace, calls, speed=1.0, num_workers=32):
+    """
+    Replays the calls of every recorded stream (producer or consumer) in the order
+    they were made, on a ConsumerPool of `num_workers` threads: a stream that waits
+    for the time of its next call, or for an id created by another stream, gives
+    its worker back to the pool. With a speed of N, every call starts N times
+    sooner than it was recorded; with a speed of 0, the calls are replayed
+    as fast as possible.
+
+    :rtype: Tuple
+    :return: (list of (call, replayed latency, replayed result), elapsed seconds)
+    """
+    streams = defaultdict(list)
+    for call in sorted(calls, key=lambda call: call[2]):
+        streams[call[1]].append(call)
+
+    ids = IdMap()
+    results = []
+    start = perf_counter()
+
+    def run(stream_calls):
+        for call in stream_calls:
+            if speed > 0:
+                delay = start + call[2] / speed - perf_counter()
+                if delay > 0:
+                    yield delay
+
+            needed = needed_id(call)
+            deadline = perf_counter() + ID_TIMEOUT
+            while needed is not None and not ids.has(*needed) and perf_counter() < deadline:
+                yield ID_POLL_INTERVAL
+
+            call_start = perf_counter()
+            result = replay_call(marketplace, ids, call)
+            # `list.append()` is atomic
+            results.append((call, perf_counter() - call_start, result))
+
+    ConsumerPool([SimpleNamespace(shop=lambda stream_calls=stream_calls: run(stream_calls))
+                  for stream_calls in streams.values()], num_workers).run()
+
+    return results, perf_counter() - start
+
+
+def percentile(values, fraction):
+    """
+    Returns a percentile of the values (0 if there are none).
+    """
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+def report(calls, results, elapsed, stream=sys.stdout):
+    """
+    Prints the throughput and the latencies of the recording and of the replay.
+    """
+    recorded_span = max(call[2] + call[3] for call in calls) - min(call[2] for call in calls)
+    print(f'{"":<26}{"recorded":>12}{"replayed":>12}{"delta":>9}', file=stream)
+    recorded_rate = len(calls) / max(recorded_span, 1e-9)
+    replayed_rate = len(results) / max(elapsed, 1e-9)
+    print(f'{"calls/s":<26}{recorded_rate:>12.0f}{replayed_rate:>12.0f}'
+          f'{(replayed_rate / recorded_rate - 1) * 100:>8.1f}%', file=stream)
+
+    recorded = defaultdict(list)
+    replayed = defaultdict(list)
+    diverged = 0
+    for call, latency, result in results:
+        recorded[call[0]].append(call[3])
+        replayed[call[0]].append(latency)
+        diverged += result != call[5]
+
+    for method in sorted(recorded):
+        for name, fraction in (('p50', 0.5), ('p99', 0.99)):
+            before = percentile(recorded[method], fraction) * 1e6
+            after = percentile(replayed[method], fraction) * 1e6
+            print(f'{method + " " + name:<26}{before:>10.1f}us{after:>10.1f}us'
+                  f'{(after / before - 1) * 100 if before else 0:>8.1f}%', file=stream)
+
+    print(f'{diverged} of {len(results)} calls returned a different result', file=stream)
+
+
+def main():
+    """
+    Replays the trace given as argument and prints the comparison.
+    """
+    parser = ArgumentParser()
+    parser.add_argument('trace', help="the trace recorded with test.py --record")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="replay N times faster than recorded (0: as fast as possible)")
+    parser.add_argument('--workers', type=int, default=32,
+                        help="the number of threads that replay the streams of calls")
+    parser.add_argument('--impl', default='tema.marketplace:Marketplace',
+                        help="the marketplace implementation, as module:Class")
+    parser.add_argument('--log', action='store_true',
+                        help="keep the marketplace's logging, like test.py when it records")
+    args = parser.parse_args()
+
+    if not args.log:
+        Logger.disable()
+
+    queue_size_per_producer, calls = read_trace(args.trace)
+    module, class_name = args.impl.split(':')
+    marketplace = getattr(import_module(module), class_name)(queue_size_per_producer)
+
+    results, elapsed = replay(marketplace, calls, args.speed, args.workers)
+    report(calls, results, elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -34,6 +34,23 @@ do
     ${PYTHON_CMD} check_test.py $i "${TESTS}/$prefix.out" "${TESTS}/$prefix.ref.out"
 done
 
+# Run tests again, with the consumers printing receipts (see tema/receipt.py)
+for i in {1..10}
+do
+    prefix=$(printf "%02d" $i)
+    rm -f "${TESTS}/$prefix".counts.out
+    echo "Starting test $i (receipts)"
+
+    timeout ${TIMEOUT_VALS[i]} ${PYTHON_CMD} test.py --receipts "${TESTS}/$prefix.in" > "${TESTS}/$prefix.counts.out"
+    if [ ! $? -eq 0 ]
+    then
+        echo "TIMEOUT. Test $i exceeded maximum allowed time of ${TIMEOUT_VALS[i]}"
+    fi
+
+    echo "Finished test $i (receipts)"
+    ${PYTHON_CMD} check_test.py $i "${TESTS}/$prefix.counts.out" "${TESTS}/$prefix.ref.counts"
+done
+
 # Pylint checks - the pylintrc file being in the same directory
 # Uncoment the following line to check your implementation's code style :)
 # ${PYTHON_CMD} -m pylint ${SRC}/*.py
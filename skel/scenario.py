@@ -0,0 +1,311 @@
+"""
+This module compiles a scenario JSON file into a compact binary file
+and loads it back lazily, by memory-mapping the file.
+
+Usage: python3 scenario.py <scenario.in|scenario.json> <scenario.bin>
+
+Binary layout (little endian, every table is an array of fixed-width records):
+    - header: magic, version, queue_size_per_producer and the (offset, count)
+      pair of every section
+    - strings: (offset, length) pairs into the UTF-8 string blob (interned)
+    - products: the interned product table, with the ids of the products
+    - producers: name, republish_wait_time and a slice of the schedules table
+    - schedules: (product index, quantity, wait_time)
+    - consumers: name, retry_wait_time and a slice of the carts table
+    - carts: a slice of the ops table
+    - ops: (op type, number of alternatives, product index, quantity)
+    - alternatives: the product indexes of the 'add_any' operations; their ops
+      refer to the first alternative instead of a product
+"""
+
+import mmap
+import struct
+import sys
+from collections.abc import Sequence
+from json import loads
+
+from tema.product import Coffee, Tea
+
+MAGIC = b'MPMC'
+VERSION = 3
+BINARY_EXTENSION = '.bin'
+
+SECTIONS = ('strings', 'blob', 'products', 'producers',
+            'schedules', 'consumers', 'carts', 'ops', 'alternatives')
+
+HEADER = struct.Struct('<4sHHI' + 'II' * len(SECTIONS))
+STRING = struct.Struct('<II') # (blob offset, length)
+PRODUCT = struct.Struct('<BxxxIIidI') # (kind, id, name, price, acidity, roast_level / type)
+PRODUCER = struct.Struct('<IdII') # (name, republish_wait_time, first schedule, count)
+SCHEDULE = struct.Struct('<IId') # (product index, quantity, wait_time)
+CONSUMER = struct.Struct('<IdII') # (name, retry_wait_time, first cart, count)
+CART = struct.Struct('<II') # (first op, count)
+OP = struct.Struct('<BBxxII') # (op type, alternatives, product / first alternative, quantity)
+ALTERNATIVE = struct.Struct('<I') # product index
+
+KIND_COFFEE = 0
+KIND_TEA = 1
+OP_TYPES = ('add', 'remove', 'add_any')
+
+
+class _Strings:
+    """
+    Interns the strings of a scenario while it is compiled.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.index = {} # {string: string index}
+        self.records = bytearray()
+        self.blob = bytearray()
+
+    def intern(self, string):
+        """
+        Returns the index of the given string, adding it to the table if needed.
+        """
+        if string not in self.index:
+            data = string.encode('utf-8')
+            self.index[string] = len(self.index)
+            self.records += STRING.pack(len(self.blob), len(data))
+            self.blob += data
+
+        return self.index[string]
+
+
+def compile_scenario(market_config):
+    """
+    Compiles a scenario into its binary representation.
+
+    :type market_config: Dict
+    :param market_config: the scenario, as it is found in the `.in` files
+
+    :rtype: bytes
+    :return: the binary scenario
+    """
+    strings = _Strings()
+    tables = {section: bytearray() for section in SECTIONS}
+
+    # Intern the products, every other table refers to them by index
+    product_index = {}
+    for product_id, product in market_config['products'].items():
+        product_index[product_id] = len(product_index)
+        if product['product_type'] == 'Coffee':
+            tables['products'] += PRODUCT.pack(KIND_COFFEE, strings.intern(product_id),
+                                               strings.intern(product['name']),
+                                               product['price'], product['acidity'],
+                                               strings.intern(product['roast_level']))
+        else:
+            tables['products'] += PRODUCT.pack(KIND_TEA, strings.intern(product_id),
+                                               strings.intern(product['name']),
+                                               product['price'], 0.0,
+                                               strings.intern(product['type']))
+
+    for producer in market_config['producers']:
+        tables['producers'] += PRODUCER.pack(strings.intern(producer['name']),
+                                             producer['republish_wait_time'],
+                                             len(tables['schedules']) // SCHEDULE.size,
+                                             len(producer['products']))
+        for product_id, quantity, wait_time in producer['products']:
+            tables['schedules'] += SCHEDULE.pack(product_index[product_id], quantity, wait_time)
+
+    for consumer in market_config['consumers']:
+        tables['consumers'] += CONSUMER.pack(strings.intern(consumer['name']),
+                                             consumer['retry_wait_time'],
+                                             len(tables['carts']) // CART.size,
+                                             len(consumer['carts']))
+        for cart in consumer['carts']:
+            tables['carts'] += CART.pack(len(tables['ops']) // OP.size, len(cart))
+            for operation in cart:
+                if 'products' in operation:
+                    first = len(tables['alternatives']) // ALTERNATIVE.size
+                    for product_id in operation['products']:
+                        tables['alternatives'] += ALTERNATIVE.pack(product_index[product_id])
+                    tables['ops'] += OP.pack(OP_TYPES.index(operation['type']),
+                                             len(operation['products']), first,
+                                             operation['quantity'])
+                else:
+                    tables['ops'] += OP.pack(OP_TYPES.index(operation['type']), 0,
+                                             product_index[operation['product']],
+                                             operation['quantity'])
+
+    tables['strings'] = strings.records
+    tables['blob'] = strings.blob
+
+    # Lay the sections one after the other, right after the header
+    offset = HEADER.size
+    section_table = []
+    for section in SECTIONS:
+        section_table += [offset, len(tables[section])]
+        offset += len(tables[section])
+
+    header = HEADER.pack(MAGIC, VERSION, 0,
+                         market_config['marketplace']['queue_size_per_producer'],
+                         *section_table)
+
+    return header + b''.join(tables[section] for section in SECTIONS)
+
+
+class _Table(Sequence):
+    """
+    Read-only view over a slice of fixed-width records.
+    Records are decoded only when they are accessed.
+    """
+
+    def __init__(self, buffer, record, start, count, decode):
+        """
+        Constructor
+
+        :type buffer: memoryview
+        :param buffer: the memory-mapped scenario
+
+        :type record: struct.Struct
+        :param record: the layout of a record
+
+        :type start: Int
+        :param start: the byte offset of the first record
+
+        :type count: Int
+        :param count: the number of records
+
+        :type decode: Callable
+        :param decode: turns the unpacked fields of a record into a value
+        """
+        self.buffer = buffer
+        self.record = record
+        self.start = start
+        self.count = count
+        self.decode = decode
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+
+        return self.decode(*self.record.unpack_from(self.buffer,
+                                                    self.start + index * self.record.size))
+
+
+class BinaryScenario:
+    """
+    A memory-mapped binary scenario. Producer schedules and consumer carts
+    are exposed as lazy sequences that decode records straight from the mapping.
+    """
+
+    def __init__(self, filename):
+        """
+        Constructor
+
+        :type filename: String
+        :param filename: the path of the binary scenario
+        """
+        with open(filename, 'rb') as input_file:
+            self.mapping = mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mapping)
+
+        magic, version, _, self.queue_size_per_producer, *section_table = \
+            HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{filename} is not a version {VERSION} binary scenario')
+        self.sections = {section: (section_table[2 * i], section_table[2 * i + 1])
+                         for i, section in enumerate(SECTIONS)}
+
+        # The product table is small, so the products are built once and shared
+        products = list(self._table('products', PRODUCT, self._decode_product))
+        self.products = [product for product, _ in products]
+        self.product_ids = dict(products) # {product: product id}, for the receipts
+
+    def _table(self, section, record, decode, first=0, count=None):
+        """
+        Returns a lazy view over `count` records of a section, starting at `first`.
+        """
+        offset, size = self.sections[section]
+        if count is None:
+            count = size // record.size
+
+        return _Table(self.buffer, record, offset + first * record.size, count, decode)
+
+    def string(self, index):
+        """
+        Returns the interned string with the given index.
+        """
+        blob_offset, length = STRING.unpack_from(self.buffer,
+                                                 self.sections['strings'][0] + index * STRING.size)
+        start = self.sections['blob'][0] + blob_offset
+
+        return str(self.buffer[start:start + length], 'utf-8')
+
+    def _decode_product(self, kind, product_id, name, price, acidity, attribute):
+        if kind == KIND_COFFEE:
+            product = Coffee(name=self.string(name), price=price,
+                             acidity=acidity, roast_level=self.string(attribute))
+        else:
+            product = Tea(name=self.string(name), price=price, type=self.string(attribute))
+
+        return product, self.string(product_id)
+
+    def _decode_schedule(self, product, quantity, wait_time):
+        return (self.products[product], quantity, wait_time)
+
+    def _decode_alternative(self, product):
+        return self.products[product]
+
+    def _decode_op(self, type_, num_alternatives, product, quantity):
+        if num_alternatives:
+            return {'type': OP_TYPES[type_],
+                    'products': self._table('alternatives', ALTERNATIVE, self._decode_alternative,
+                                            product, num_alternatives),
+                    'quantity': quantity}
+
+        return {'type': OP_TYPES[type_], 'product': self.products[product],
+                'quantity': quantity}
+
+    def _decode_cart(self, first, count):
+        return self._table('ops', OP, self._decode_op, first, count)
+
+    def _decode_producer(self, name, republish_wait_time, first, count):
+        return {'name': self.string(name),
+                'products': self._table('schedules', SCHEDULE, self._decode_schedule,
+                                        first, count),
+                'republish_wait_time': republish_wait_time}
+
+    def _decode_consumer(self, name, retry_wait_time, first, count):
+        return {'name': self.string(name),
+                'retry_wait_time': retry_wait_time,
+                'carts': self._table('carts', CART, self._decode_cart, first, count)}
+
+    def market_config(self):
+        """
+        Returns the scenario in the same shape `test.py` builds from a `.in` file,
+        with the product ids already resolved.
+        """
+        return {'marketplace': {'queue_size_per_producer': self.queue_size_per_producer},
+                'product_ids': self.product_ids,
+                'producers': self._table('producers', PRODUCER, self._decode_producer),
+                'consumers': self._table('consumers', CONSUMER, self._decode_consumer)}
+
+
+def main():
+    """
+    Compiles the scenario given as the first argument into the file given as the second one.
+    """
+    if len(sys.argv) != 3:
+        print("Usage: scenario.py scenario_filepath binary_filepath")
+        return
+
+    with open(sys.argv[1], encoding='utf-8') as input_file:
+        market_config = loads(input_file.read())
+
+    with open(sys.argv[2], 'wb') as output_file:
+        output_file.write(compile_scenario(market_config))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+"""
+This module hammers a Marketplace implementation from many threads, records
+the history of the operations and checks the marketplace invariants afterwards:
+    - stock is conserved: every published unit is either in stock or in a cart
+    - no producer publishes beyond `queue_size_per_producer`
+    - each unit is owned by at most one cart
+    - every unit keeps the producer that published it (provenance)
+
+The state is read through the public methods `stock_by_producer()`, `producer_load()`,
+`available()` and `cart()`, so any implementation that has them can be checked.
+
+Usage: python3 stress.py [--producers P] [--consumers C] [--ops N] [--impl module:Class]
+"""
+
+import random
+import sys
+from argparse import ArgumentParser
+from bisect import bisect_left
+from collections import Counter
+from importlib import import_module
+from threading import Thread
+from time import perf_counter
+
+from tema.logger import Logger
+from tema.product import Coffee, Tea
+
+
+def catalog(num_products):
+    """
+    Returns `num_products` distinct products.
+    """
+    return [Coffee(name=f'Stress{i}', price=i % 10 + 1, acidity=5.0, roast_level='MEDIUM')
+            if i % 2 == 0 else Tea(name=f'Stress{i}', price=i % 10 + 1, type='Black')
+            for i in range(num_products)]
+
+
+class Worker(Thread):
+    """
+    Base class of the stress threads. Every thread records its own history,
+    so recording doesn't add any synchronization between the threads.
+    """
+
+    def __init__(self, marketplace, products, weights, num_ops, seed, **kwargs):
+        Thread.__init__(self, **kwargs)
+        self.marketplace = marketplace
+        self.products = products
+        self.weights = weights
+        self.num_ops = num_ops
+        self.random = random.Random(seed)
+        self.history = [] # [(op, args, result, start, end)]
+
+    def call(self, op, *args):
+        """
+        Calls `op` on the marketplace and records it in the history.
+        """
+        start = perf_counter()
+        result = getattr(self.marketplace, op)(*args)
+        self.history.append((op, args, result, start, perf_counter()))
+
+        return result
+
+    def pick(self):
+        """
+        Picks a product, skewed towards the first products of the catalog.
+        """
+        return self.random.choices(self.products, self.weights)[0]
+
+
+class StressProducer(Worker):
+    """
+    Publishes random products.
+    """
+
+    def __init__(self, *args, **kwargs):
+        Worker.__init__(self, *args, **kwargs)
+        self.producer_id = self.marketplace.register_producer()
+
+    def run(self):
+        for _ in range(self.num_ops):
+            self.call('publish', self.producer_id, self.pick())
+
+
+class StressConsumer(Worker):
+    """
+    Performs random cart operations. Every cart is used by a single consumer.
+    """
+
+    def __init__(self, *args, **kwargs):
+        Worker.__init__(self, *args, **kwargs)
+        self.expected = {} # {cart_id: Counter({product: quantity})}
+        self.orders = {} # {cart_id: list of products returned by `place_order()`}
+        self.claims = [] # [(producer_id, start, end)] of the units added to the carts
+        self.returns = [] # [(producer_id, start, end)] of the units removed from the carts
+
+    def cart_items(self, cart_id):
+        """
+        Returns the items of a cart. Only this consumer changes its carts,
+        so they can be read without synchronization.
+        """
+        return self.marketplace.cart(cart_id).products
+
+    def run(self):
+        cart_id = self.call('new_cart')
+        self.expected[cart_id] = Counter()
+
+        for _ in range(self.num_ops):
+            choice = self.random.random()
+            cart = self.expected[cart_id]
+
+            if choice < 0.6:
+                product = self.pick()
+                if self.call('add_to_cart', cart_id, product):
+                    cart[product] += 1
+                    # The unit is appended to the cart
+                    _, _, _, start, end = self.history[-1]
+                    self.claims.append((self.cart_items(cart_id)[-1]['producer_id'], start, end))
+            elif choice < 0.85:
+                # Mostly remove what is in the cart, sometimes something that isn't
+                in_cart = list(+cart)
+                product = self.random.choice(in_cart) \
+                    if in_cart and self.random.random() < 0.9 else self.pick()
+                # The first matching unit of the cart is the one that is removed
+                producer_id = next((item['producer_id'] for item in self.cart_items(cart_id)
+                                    if item['product'] == product), None)
+                if self.call('remove_from_cart', cart_id, product):
+                    cart[product] -= 1
+                    _, _, _, start, end = self.history[-1]
+                    self.returns.append((producer_id, start, end))
+            else:
+                self.orders[cart_id] = self.call('place_order', cart_id)
+                cart_id = self.call('new_cart')
+                self.expected[cart_id] = Counter()
+
+
+def check_capacity(queue_size, producers, consumers):
+    """
+    Checks that no `publish()` succeeded while its producer was full.
+    A producer publishes sequentially, so before its k-th successful publish it has
+    at least (k - 1) published units, minus the units that may have been claimed
+    by then, plus the units that were surely returned by then.
+
+    :rtype: List
+    :return: the violated invariants, one message for each violation
+    """
+    violations = []
+    claims = {}
+    returns = {}
+    for consumer in consumers:
+        for producer_id, start, _ in consumer.claims:
+            claims.setdefault(producer_id, []).append(start)
+        for producer_id, _, end in consumer.returns:
+            returns.setdefault(producer_id, []).append(end)
+
+    for producer in producers:
+        producer_claims = sorted(claims.get(producer.producer_id, []))
+        producer_returns = sorted(returns.get(producer.producer_id, []))
+        published = 0
+        for _, _, result, start, end in producer.history:
+            if not result:
+                continue
+            lower_bound = published - bisect_left(producer_claims, end) \
+                + bisect_left(producer_returns, start)
+            if lower_bound >= queue_size:
+                violations.append(f'capacity: producer {producer.producer_id} published '
+                                  f'with at least {lower_bound} products')
+            published += 1
+
+    return violations
+
+
+def check_invariants(marketplace, producers, consumers):
+    """
+    Checks the final state of the marketplace against the recorded histories.
+
+    :rtype: List
+    :return: the violated invariants, one message for each violation
+    """
+    violations = []
+
+    # Units published by every producer, per product
+    published = Counter()
+    for producer in producers:
+        for _, (producer_id, product), result, _, _ in producer.history:
+            if result:
+                published[(product, producer_id)] += 1
+
+    # Units in stock and units owned by the carts (all created by the consumers),
+    # per (product, producer)
+    in_stock = Counter()
+    for producer_id, units in marketplace.stock_by_producer().items():
+        for product, count in units.items():
+            in_stock[(product, producer_id)] += count
+
+    in_carts = Counter()
+    for consumer in consumers:
+        for cart_id in consumer.expected:
+            for item in marketplace.cart(cart_id).products:
+                in_carts[(item['product'], item['producer_id'])] += 1
+
+    for key in set(published) | set(in_stock) | set(in_carts):
+        product, producer_id = key
+        if published[key] == 0:
+            violations.append(f'provenance: {product} attributed to producer {producer_id}, '
+                              f'which never published it')
+        elif in_stock[key] + in_carts[key] != published[key]:
+            violations.append(f'conservation: producer {producer_id} published {published[key]} '
+                              f'x {product}, {in_stock[key]} in stock, {in_carts[key]} in carts')
+
+    # Every producer stays within its queue and its counter matches the stock
+    stock_per_producer = Counter()
+    for (_, producer_id), units in in_stock.items():
+        stock_per_producer[producer_id] += units
+    for producer in producers:
+        producer_id = producer.producer_id
+        counted = marketplace.producer_load(producer_id)
+        if counted != stock_per_producer[producer_id]:
+            violations.append(f'capacity: producer {producer_id} counts {counted} products, '
+                              f'{stock_per_producer[producer_id]} in stock')
+    violations += check_capacity(marketplace.queue_size_per_producer, producers, consumers)
+
+    # The lock-free reads of the products agree with the stock, once the workers are done
+    for product in {product for product, _ in in_stock}:
+        units = sum(count for (other, _), count in in_stock.items() if other == product)
+        if marketplace.available(product) != units:
+            violations.append(f'snapshot: {marketplace.available(product)} x {product} '
+                              f'available, {units} in stock')
+
+    # Every cart holds exactly what its consumer successfully added and didn't remove,
+    # so no unit is owned by two carts
+    for consumer in consumers:
+        for cart_id, expected in consumer.expected.items():
+            owned = Counter(marketplace.cart(cart_id).get_products())
+            if owned != +expected:
+                violations.append(f'ownership: cart {cart_id} holds {dict(owned)}, '
+                                  f'expected {dict(+expected)}')
+            if cart_id in consumer.orders and Counter(consumer.orders[cart_id]) != owned:
+                violations.append(f'ownership: order of cart {cart_id} differs from the cart')
+            summary = marketplace.cart(cart_id).summary()
+            if summary.num_items != sum(owned.values()) or \
+                    summary.total_price != sum(product.price for product in owned.elements()):
+                violations.append(f'summary: cart {cart_id} summarizes {summary}')
+
+    return violations
+
+
+def report(workers, elapsed):
+    """
+    Prints the throughput and the mean latency of every operation.
+    """
+    calls = Counter()
+    latency = Counter()
+    for worker in workers:
+        for op, _, _, start, end in worker.history:
+            calls[op] += 1
+            latency[op] += end - start
+
+    total = sum(calls.values())
+    print(f'{total} operations in {elapsed:.3f}s: {total / elapsed:.0f} ops/s')
+    for op in sorted(calls):
+        print(f'    {op:<18}{calls[op]:>10}{calls[op] / elapsed:>12.0f} ops/s'
+              f'{latency[op] / calls[op] * 1e6:>10.1f} us/op')
+
+
+def run_stress(marketplace, num_producers, num_consumers, num_products, num_ops, seed=0,
+               skew=1.0):
+    """
+    Runs the producer and consumer threads against the marketplace.
+    The product of rank r is picked with a weight of 1 / (r + 1) ** skew.
+
+    :rtype: Tuple
+    :return: (producers, consumers, elapsed seconds)
+    """
+    products = catalog(num_products)
+    weights = [1 / (rank + 1) ** skew for rank in range(len(products))]
+    producers = [StressProducer(marketplace, products, weights, num_ops, seed * 1000 + i)
+                 for i in range(num_producers)]
+    consumers = [StressConsumer(marketplace, products, weights, num_ops,
+                                seed * 1000 + num_producers + i)
+                 for i in range(num_consumers)]
+
+    start = perf_counter()
+    for worker in producers + consumers:
+        worker.start()
+    for worker in producers + consumers:
+        worker.join()
+
+    return producers, consumers, perf_counter() - start
+
+
+def main():
+    """
+    Runs the stress test and exits with 1 if any invariant was violated.
+    """
+    parser = ArgumentParser()
+    parser.add_argument('--producers', type=int, default=8, help="number of producer threads")
+    parser.add_argument('--consumers', type=int, default=32, help="number of consumer threads")
+    parser.add_argument('--products', type=int, default=10, help="number of distinct products")
+    parser.add_argument('--queue-size', type=int, default=8, help="queue size per producer")
+    parser.add_argument('--ops', type=int, default=2000, help="operations per thread")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the interleavings")
+    parser.add_argument('--impl', default='tema.marketplace:Marketplace',
+                        help="the marketplace implementation, as module:Class")
+    args = parser.parse_args()
+
+    Logger.disable()
+    # Switch threads as often as possible, to get more interleavings
+    sys.setswitchinterval(1e-6)
+
+    module, class_name = args.impl.split(':')
+    marketplace = getattr(import_module(module), class_name)(args.queue_size)
+
+    producers, consumers, elapsed = run_stress(marketplace, args.producers, args.consumers,
+                                               args.products, args.ops, args.seed)
+
+    report(producers + consumers, elapsed)
+
+    violations = check_invariants(marketplace, producers, consumers)
+    for violation in violations:
+        print(violation)
+    print(f'{len(violations)} invariant violations')
+
+    if violations:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
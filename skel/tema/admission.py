@@ -0,0 +1,161 @@
+"""
+This module represents the AdmissionController.
+"""
+
+from threading import Lock
+from time import monotonic
+
+class Rejected:
+    """
+    Falsy result of an `add_to_cart()` that was rejected by the admission control,
+    with a hint of how long the caller should wait before retrying.
+    """
+
+    def __init__(self, retry_after):
+        """
+        Constructor
+
+        :type retry_after: Float
+        :param retry_after: the suggested number of seconds to wait before retrying
+        """
+        self.retry_after = retry_after
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return f'Rejected(retry_after={self.retry_after:.3f})'
+
+
+class TokenBucket:
+    """
+    Class that represents a token bucket: it refills with `rate` tokens per second,
+    up to `burst` tokens.
+    """
+
+    def __init__(self, rate, burst, now):
+        """
+        Constructor
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now):
+        """
+        Takes a token from the bucket.
+
+        :rtype: Float
+        :return: 0 if a token was taken, else the number of seconds until one is available
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """
+    Class that sheds the load of the `add_to_cart()` retries when the consumers
+    outnumber the available stock. Only the attempts on products that look out of
+    stock are subject to it, so the reservations that can succeed are never delayed:
+        - every caller (cart) and every product has a token bucket for its retries
+        - at most `max_waiting` carts can wait for a product at the same time
+    A rejected attempt returns without taking the stock lock, with a retry-after hint.
+    """
+
+    def __init__(self, caller_rate=5.0, caller_burst=2, product_rate=50.0, product_burst=10,
+                 max_waiting=32, waiting_retry_after=0.5):
+        """
+        Constructor
+
+        :type caller_rate: Float
+        :param caller_rate: the retries per second allowed for each caller
+
+        :type caller_burst: Int
+        :param caller_burst: the size of the token bucket of each caller
+
+        :type product_rate: Float
+        :param product_rate: the retries per second allowed for each product
+
+        :type product_burst: Int
+        :param product_burst: the size of the token bucket of each product
+
+        :type max_waiting: Int
+        :param max_waiting: the maximum number of carts waiting for a product at the same time
+
+        :type waiting_retry_after: Float
+        :param waiting_retry_after: the retry-after hint given when too many carts are waiting
+        """
+        self.caller_rate = caller_rate
+        self.caller_burst = caller_burst
+        self.product_rate = product_rate
+        self.product_burst = product_burst
+        self.max_waiting = max_waiting
+        self.waiting_retry_after = waiting_retry_after
+
+        self.caller_buckets = {} # {cart_id: TokenBucket}
+        self.product_buckets = {} # {product: TokenBucket}
+        self.waiting = set() # Carts that failed to reserve a product and are retrying
+        self.rejected = 0 # Number of rejected attempts
+        self.lock = Lock() # Lock for the buckets and `waiting`, never held for long
+
+    def admit(self, cart_id, product):
+        """
+        Decides if an attempt to reserve a product that looks out of stock may proceed.
+
+        :rtype: Rejected
+        :return: None if the attempt may proceed, else the rejection
+        """
+        now = monotonic()
+        with self.lock:
+            if cart_id not in self.waiting and len(self.waiting) >= self.max_waiting:
+                retry_after = self.waiting_retry_after
+            else:
+                caller = self.caller_buckets.get(cart_id)
+                if caller is None:
+                    caller = self.caller_buckets[cart_id] = \
+                        TokenBucket(self.caller_rate, self.caller_burst, now)
+                retry_after = caller.take(now)
+
+                if not retry_after:
+                    bucket = self.product_buckets.get(product)
+                    if bucket is None:
+                        bucket = self.product_buckets[product] = \
+                            TokenBucket(self.product_rate, self.product_burst, now)
+                    retry_after = bucket.take(now)
+
+            if not retry_after:
+                return None
+
+            self.rejected += 1
+
+        return Rejected(retry_after)
+
+    def failed(self, cart_id):
+        """
+        Records that the cart failed to reserve a product and is going to retry.
+        """
+        with self.lock:
+            if len(self.waiting) < self.max_waiting:
+                self.waiting.add(cart_id)
+
+    def succeeded(self, cart_id):
+        """
+        Records that the cart reserved a product, so it's not waiting anymore.
+        """
+        if cart_id in self.waiting:
+            with self.lock:
+                self.waiting.discard(cart_id)
+
+    def forget(self, cart_id):
+        """
+        Forgets the state of a cart, once its order is placed.
+        """
+        with self.lock:
+            self.waiting.discard(cart_id)
+            self.caller_buckets.pop(cart_id, None)
@@ -0,0 +1,193 @@
+"""
+This module represents the AutoTuner.
+"""
+
+import sys
+from threading import Thread, Event
+
+class AutoTuner(Thread):
+    """
+    Class that tunes the Marketplace while it runs. Every `period` seconds, it computes
+    the rates of the last period from the Marketplace's running totals:
+        - the rejection rate: the share of the `publish()` calls that were rejected
+        - the failure rate: the share of the `add_to_cart()` calls that failed
+        - the backlog: the share of the producers' capacity that is in stock
+        - the mean order latency, from the creation of a cart to its order
+    and adjusts, within bounds:
+        - the capacity of the producers' queues: up when the producers are rejected while
+          the consumers fail, down when it's mostly unused while the consumers are served
+        - the producers' wait times: up when they are rejected while the consumers are served,
+          down when the consumers fail while the producers are not rejected
+        - the consumers' wait times: up while their retries mostly fail, down otherwise
+    A period without any `publish()` or without any `add_to_cart()` is skipped.
+    Every decision is printed to `stream`, so that the values it converges to can be pinned.
+    """
+
+    def __init__(self, marketplace, producers, consumers, period=0.5, capacity=(1, None),
+                 wait_scale=(0.25, 4.0), high=0.5, low=0.1, stream=sys.stderr, **kwargs):
+        """
+        Constructor.
+
+        :type marketplace: Marketplace
+        :param marketplace: the marketplace to tune
+
+        :type producers: List
+        :param producers: the producers, whose `republish_wait_time` is tuned
+
+        :type consumers: List
+        :param consumers: the consumers, whose `retry_wait_time` is tuned
+
+        :type period: Float
+        :param period: the number of seconds between two decisions
+
+        :type capacity: Tuple
+        :param capacity: the bounds of the queue size per producer
+            (the upper bound is 4 times the initial size if it's None)
+
+        :type wait_scale: Tuple
+        :param wait_scale: the bounds of the wait times, relative to the configured ones
+
+        :type high: Float
+        :param high: the rate above which a rejection or failure rate is high
+
+        :type low: Float
+        :param low: the rate below which a rejection or failure rate is low
+
+        :type kwargs:
+        :param kwargs: other arguments that are passed to the Thread's __init__()
+        """
+        Thread.__init__(self, **kwargs)
+        self.marketplace = marketplace
+        self.producers = producers
+        self.consumers = consumers
+        self.period = period
+        initial = marketplace.queue_size_per_producer
+        self.capacity = (capacity[0], capacity[1] or 4 * initial)
+        self.wait_scale = wait_scale
+        self.high = high
+        self.low = low
+        self.stream = stream
+
+        # The configured wait times, that the scales apply to
+        self.republish_wait_times = [producer.republish_wait_time for producer in producers]
+        self.retry_wait_times = [consumer.retry_wait_time for consumer in consumers]
+        self.producer_scale = 1.0 # Current scale of the producers' wait times
+        self.consumer_scale = 1.0 # Current scale of the consumers' wait times
+
+        self.decisions = [] # (time, knob, old value, new value, reason)
+        self.stopped = Event() # Set when the auto-tuner must stop
+
+    def stop(self):
+        """
+        Stops the auto-tuner, waits for it to finish and prints the values it converged to.
+        """
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+        print(f'AUTOTUNE: converged to queue_size_per_producer='
+              f'{self.marketplace.queue_size_per_producer}, '
+              f'producer wait scale={self.producer_scale:.3g}, '
+              f'consumer wait scale={self.consumer_scale:.3g}', file=self.stream, flush=True)
+
+    def run(self):
+        previous = dict(self.marketplace.stats)
+        elapsed = 0.0
+        while not self.stopped.wait(self.period):
+            elapsed += self.period
+            stats = dict(self.marketplace.stats)
+            delta = {key: stats[key] - previous[key] for key in stats}
+            previous = stats
+            self.tune(elapsed, delta)
+
+    @staticmethod
+    def rate(part, other):
+        """
+        Returns the share of `part` in `part + other` (0 if both are 0).
+        """
+        return part / (part + other) if part + other else 0.0
+
+    def tune(self, now, delta):
+        """
+        Takes the decisions of a period.
+
+        :type now: Float
+        :param now: the time of the decisions, since the auto-tuner started
+
+        :type delta: Dict
+        :param delta: the change of the marketplace's running totals over the period
+        """
+        # An idle period (e.g. the producers sleep out a long wait time) says nothing
+        # about the health of the marketplace: low rates there are no reason to shrink
+        if not delta['published'] + delta['publish_rejected'] or \
+                not delta['reserved'] + delta['add_failed']:
+            return
+
+        rejection = self.rate(delta['publish_rejected'], delta['published'])
+        failure = self.rate(delta['add_failed'], delta['reserved'])
+        queue_size = self.marketplace.queue_size_per_producer
+        units = sum(self.marketplace.producer_load(producer.producer_id)
+                    for producer in self.producers)
+        backlog = units / max(queue_size * len(self.producers), 1)
+        latency = delta['order_time'] / delta['orders'] if delta['orders'] else None
+        # The consumers are only served if they actually reserved something
+        served = failure < self.low and delta['reserved'] > 0
+        metrics = (f'rejection {rejection:.2f}, failure {failure:.2f}, backlog {backlog:.2f}, '
+                   f'order latency {"-" if latency is None else f"{latency:.3f}s"}')
+
+        # Capacity of the producers' queues
+        if rejection > self.high and failure > self.high:
+            self.set_capacity(now, queue_size + 1, metrics)
+        elif rejection < self.low and served and backlog < 0.5:
+            self.set_capacity(now, queue_size - 1, metrics)
+
+        # Producers' wait times
+        if rejection > self.high and served:
+            self.set_producer_scale(now, self.producer_scale * 1.5, metrics)
+        elif failure > self.high and rejection < self.low:
+            self.set_producer_scale(now, self.producer_scale / 1.5, metrics)
+
+        # Consumers' wait times
+        if failure > self.high:
+            self.set_consumer_scale(now, self.consumer_scale * 1.5, metrics)
+        elif served:
+            self.set_consumer_scale(now, self.consumer_scale / 1.5, metrics)
+
+    def decide(self, now, knob, old, new, reason):
+        """
+        Records and prints a decision.
+        """
+        self.decisions.append((now, knob, old, new, reason))
+        print(f'AUTOTUNE {now:.1f}s: {knob} {old:.3g} -> {new:.3g} ({reason})',
+              file=self.stream, flush=True)
+
+    def set_capacity(self, now, queue_size, reason):
+        """
+        Sets the queue size per producer, within its bounds.
+        """
+        queue_size = min(max(queue_size, self.capacity[0]), self.capacity[1])
+        if queue_size != self.marketplace.queue_size_per_producer:
+            self.decide(now, 'queue_size_per_producer', self.marketplace.queue_size_per_producer,
+                        queue_size, reason)
+            self.marketplace.queue_size_per_producer = queue_size
+
+    def set_producer_scale(self, now, scale, reason):
+        """
+        Scales the producers' wait times, within the bounds.
+        """
+        scale = min(max(scale, self.wait_scale[0]), self.wait_scale[1])
+        if scale != self.producer_scale:
+            self.decide(now, 'producer wait scale', self.producer_scale, scale, reason)
+            self.producer_scale = scale
+            for producer, wait_time in zip(self.producers, self.republish_wait_times):
+                producer.republish_wait_time = wait_time * scale
+
+    def set_consumer_scale(self, now, scale, reason):
+        """
+        Scales the consumers' wait times, within the bounds.
+        """
+        scale = min(max(scale, self.wait_scale[0]), self.wait_scale[1])
+        if scale != self.consumer_scale:
+            self.decide(now, 'consumer wait scale', self.consumer_scale, scale, reason)
+            self.consumer_scale = scale
+            for consumer, wait_time in zip(self.consumers, self.retry_wait_times):
+                consumer.retry_wait_time = wait_time * scale
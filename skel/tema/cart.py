@@ -2,9 +2,17 @@
 This module represents the Cart.
 """
 
+from collections import namedtuple
+from time import monotonic
+
+# Compact description of an order: `types` is {product type: count}
+# and `producers` is {producer_id: count}
+OrderSummary = namedtuple('OrderSummary', ['total_price', 'num_items', 'types', 'producers'])
+
 class Cart:
     """
     Class that represents a shopping cart. It's used by the consumers.
+    Its aggregates are updated on every change, so its summary doesn't depend on its size.
     """
 
     def __init__(self):
@@ -12,6 +20,11 @@ class Cart:
         Constructor
         """
         self.products = []
+        self.created = monotonic() # When the cart was created, for the order latency
+        self.total_price = 0 # Total price of the products in the cart
+        self.type_counts = {} # {product type: count}
+        self.producer_counts = {} # {producer_id: count}
+        self.product_counts = {} # {product: count}
 
     def add_product(self, product, producer_id):
         """
@@ -28,6 +41,21 @@ class Cart:
             'product': product,
             'producer_id': producer_id
         })
+        self._count(product, producer_id, 1)
+
+    def _count(self, product, producer_id, delta):
+        """
+        Updates the aggregates with a product added (delta 1) or removed (delta -1).
+        """
+        self.total_price += delta * product.price
+        for counts, key in ((self.type_counts, type(product).__name__),
+                            (self.producer_counts, producer_id),
+                            (self.product_counts, product)):
+            count = counts.get(key, 0) + delta
+            if count:
+                counts[key] = count
+            else:
+                del counts[key]
 
     def remove_product(self, product):
         """
@@ -44,6 +72,7 @@ class Cart:
         for item in self.products:
             if item['product'] == product:
                 self.products.remove(item)
+                self._count(product, item['producer_id'], -1)
                 return item['producer_id']
 
         return -1
@@ -56,3 +85,22 @@ class Cart:
         :return: the list of products in the shopping cart
         """
         return [item['product'] for item in self.products]
+
+    def summary(self):
+        """
+        Returns the summary of the products in the shopping cart.
+
+        :rtype: OrderSummary
+        :return: the total price, the number of items, and the counts per type and per producer
+        """
+        return OrderSummary(self.total_price, len(self.products),
+                            dict(self.type_counts), dict(self.producer_counts))
+
+    def receipt(self):
+        """
+        Returns the number of units of every product in the shopping cart.
+
+        :rtype: Dict
+        :return: {product: count}
+        """
+        return dict(self.product_counts)
@@ -0,0 +1,132 @@
+"""
+This module represents the ChangeFeed.
+"""
+
+from collections import namedtuple
+from itertools import count
+from threading import Lock
+from time import monotonic
+
+# `product` is the tuple of ordered products for the 'order_placed' events
+MarketEvent = namedtuple('MarketEvent',
+                         ['seq', 'kind', 'time', 'producer_id', 'cart_id', 'product'])
+
+class ChangeFeed:
+    """
+    Class that publishes the Marketplace events to its subscribers, through a bounded
+    ring buffer. Writers never wait: they claim a sequence number and overwrite
+    the oldest slot. Every subscriber reads at its own cursor, so a slow subscriber
+    lags behind and, once it's overrun, drops the events it missed.
+    """
+
+    KINDS = ('published', 'reserved', 'returned', 'order_placed', 'wanted')
+
+    def __init__(self, capacity=1 << 12):
+        """
+        Constructor
+
+        :type capacity: Int
+        :param capacity: the number of events kept in the ring buffer
+        """
+        self.capacity = capacity
+        self.slots = [None] * capacity # Ring buffer of MarketEvent
+        self.sequence = count() # `next()` is atomic, so claiming a slot needs no lock
+        self.written = 0 # Number of events written, for new subscribers
+        self.num_subscribers = 0 # Events are only written if someone listens
+        self.lock = Lock() # Guards `written` and `num_subscribers`, never the slots
+
+    def emit(self, kind, product=None, producer_id=-1, cart_id=-1):
+        """
+        Writes an event to the ring buffer, if there are any subscribers.
+
+        :type kind: String
+        :param kind: one of `ChangeFeed.KINDS`
+        """
+        if not self.num_subscribers:
+            return
+
+        seq = next(self.sequence)
+        self.slots[seq % self.capacity] = MarketEvent(seq, kind, monotonic(),
+                                                      producer_id, cart_id, product)
+        with self.lock:
+            # A writer that claimed a later sequence number may have finished first
+            self.written = max(self.written, seq + 1)
+
+    def subscribe(self):
+        """
+        Returns a new subscription, that receives the events written from now on.
+        """
+        with self.lock:
+            self.num_subscribers += 1
+            return Subscription(self, self.written)
+
+
+class Subscription:
+    """
+    Class that represents a subscriber of a ChangeFeed, with its own cursor.
+    """
+
+    def __init__(self, feed, cursor):
+        """
+        Constructor
+        """
+        self.feed = feed
+        self.cursor = cursor # Sequence number of the next event to read
+        self.dropped = 0 # Number of events overwritten before they were read
+
+    def poll(self, max_events=None):
+        """
+        Returns the available events, in order, without blocking.
+
+        :type max_events: Int
+        :param max_events: the maximum number of events returned (all if None)
+
+        :rtype: List
+        :return: the events
+        """
+        events = []
+        slots = self.feed.slots
+        capacity = self.feed.capacity
+
+        while max_events is None or len(events) < max_events:
+            event = slots[self.cursor % capacity]
+            if event is None or event.seq < self.cursor:
+                # Not written yet
+                break
+
+            if event.seq > self.cursor:
+                # Overrun: the writers reached `event.seq`, so only the latest
+                # `capacity` events before it can still be in the ring buffer
+                oldest = event.seq - capacity + 1
+                self.dropped += oldest - self.cursor
+                self.cursor = oldest
+                continue
+
+            events.append(event)
+            self.cursor += 1
+
+        return events
+
+    @property
+    def lag(self):
+        """
+        Returns the approximate number of events not read yet.
+        """
+        return max(self.feed.written - self.cursor, 0)
+
+    def __iter__(self):
+        """
+        Iterates over the available events, without blocking.
+        """
+        while True:
+            events = self.poll(64)
+            if not events:
+                return
+            yield from events
+
+    def close(self):
+        """
+        Unsubscribes from the feed.
+        """
+        with self.feed.lock:
+            self.feed.num_subscribers -= 1
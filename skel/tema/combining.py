@@ -0,0 +1,106 @@
+"""
+This module represents the FlatCombiner.
+"""
+
+from collections import deque
+from threading import Lock
+
+class _Request:
+    """
+    A request posted to a publication list: the operation, its arguments and its result.
+    """
+
+    __slots__ = ('apply', 'args', 'result', 'error', 'done')
+
+    def __init__(self, apply, args):
+        self.apply = apply
+        self.args = args
+        self.result = None
+        self.error = None
+        self.done = Lock() # Released by the combiner once the request is applied
+        self.done.acquire()
+
+
+class FlatCombiner:
+    """
+    Class that applies the operations on a hot key in batches. When the lock is free,
+    an operation is applied right away. Otherwise, the thread posts its request to the
+    key's publication list and one of the waiting threads becomes the key's combiner:
+    it applies the whole batch of requests under a single hold of the lock and hands
+    the results back, while the other threads wait for theirs.
+    """
+
+    def __init__(self, lock, max_batch=64, poll_interval=0.0002):
+        """
+        Constructor
+
+        :type lock: Lock
+        :param lock: the lock that guards the state the operations change
+
+        :type max_batch: Int
+        :param max_batch: the maximum number of requests applied under one hold of the lock
+
+        :type poll_interval: Float
+        :param poll_interval: how long a waiting thread waits before trying to become the combiner
+        """
+        self.lock = lock
+        self.max_batch = max_batch
+        self.poll_interval = poll_interval
+
+        self.publications = {} # {key: deque of pending requests}
+        self.combiner_locks = {} # {key: Lock held by the key's combiner}
+        # Statistics of all the keys, only changed under the lock
+        self.batches = 0 # Number of (non-empty) batches applied by the combiners
+        self.combined = 0 # Number of requests applied by the combiners
+
+    def submit(self, key, apply, *args):
+        """
+        Applies `apply(*args)` under the lock, directly or through the key's combiner.
+        The caller's request is applied in the order it was posted among the key's requests.
+
+        :returns the result of `apply(*args)`
+        """
+        # Fast path: the lock is free, so there is nothing to combine
+        if self.lock.acquire(False):
+            try:
+                return apply(*args)
+            finally:
+                self.lock.release()
+
+        # `setdefault()` is atomic, so every thread gets the same list and lock
+        pending = self.publications.get(key) or self.publications.setdefault(key, deque())
+        combiner = self.combiner_locks.get(key) or self.combiner_locks.setdefault(key, Lock())
+
+        request = _Request(apply, args)
+        pending.append(request)
+        while True:
+            if combiner.acquire(False):
+                try:
+                    self._combine(pending)
+                finally:
+                    combiner.release()
+
+            if request.done.acquire(timeout=self.poll_interval):
+                if request.error is not None:
+                    raise request.error
+                return request.result
+
+    def _combine(self, pending):
+        """
+        Applies a batch of pending requests under a single hold of the lock.
+        The caller must be the key's combiner.
+        """
+        with self.lock:
+            applied = 0
+            while pending and applied < self.max_batch:
+                request = pending.popleft()
+                try:
+                    request.result = request.apply(*request.args)
+                except Exception as error: # pylint: disable=broad-except
+                    request.error = error
+                request.done.release()
+                applied += 1
+
+            if applied:
+                self.batches += 1
+                self.combined += applied
@@ -2,15 +2,32 @@
 This module represents the Consumer.
 """
 
+from collections import Counter
 from threading import Thread, Lock
 from time import sleep
+try:
+    from .tracer import TRACER
+except ImportError:
+    from tracer import TRACER
+try:
+    from .profiler import PROFILER
+except ImportError:
+    from profiler import PROFILER
+try:
+    from .receipt import format_receipt
+except ImportError:
+    from receipt import format_receipt
+try:
+    from .recorder import set_caller
+except ImportError:
+    from recorder import set_caller
 
 class Consumer(Thread):
     """
     Class that represents a consumer.
     """
 
-    def __init__(self, carts, marketplace, retry_wait_time, **kwargs):
+    def __init__(self, carts, marketplace, retry_wait_time, product_ids=None, **kwargs):
         """
         Constructor.
 
@@ -24,6 +41,11 @@ class Consumer(Thread):
         :param retry_wait_time: the number of seconds that a producer must wait
         until the Marketplace becomes available
 
+        :type product_ids: Dict
+        :param product_ids: {product: product_id}; if given, the consumer prints its receipts
+        (one `name product_id count` line per product, see receipt.py) once all its carts are
+        ordered, instead of a line for every unit it bought
+
         :type kwargs:
         :param kwargs: other arguments that are passed to the Thread's __init__()
         """
@@ -33,40 +55,85 @@ class Consumer(Thread):
         self.retry_wait_time = retry_wait_time # Time to wait before retrying an operation
         self.name = kwargs['name'] # Consumer name
         self.print_lock = Lock() # Lock for thread safe printing
+        self.waiting_for = None # Product (or alternatives) the consumer waits for, if any
+        self.product_ids = product_ids # {product: product_id}, to print receipts
+        self.receipts = Counter() # {product: units bought over all the carts}
 
-    def run(self):
-        def perform_op(operation):
-            """
-            Perform an operation on the cart.
-
-            :type op: Dict
-            :param op: the operation to perform
-
-            :rtype: None
-            """
-            # Unpack the operation in `type_`, `product` and `quantity`
-            type_, product, quantity = operation.values()
-
-            # Perform the operation `quantity` times
-            for _ in range(quantity):
-                if type_ == 'add':
-                    # Wait until the Marketplace signals that the `Consumer` can add to cart
-                    while not self.marketplace.add_to_cart(cart_id, product):
-                        sleep(self.retry_wait_time)
-                elif type_ == 'remove':
-                    self.marketplace.remove_from_cart(cart_id, product)
+    def perform_op(self, cart_id, operation):
+        """
+        Perform an operation on the cart. Yields the number of seconds to wait
+        every time the operation can't make progress.
+
+        :type cart_id: Int
+        :param cart_id: the cart the operation is performed on
+
+        :type operation: Dict
+        :param operation: the operation to perform
+        """
+        # Unpack the operation in `type_`, `product` and `quantity`
+        # (`product` is the list of alternatives of an 'add_any' operation)
+        type_, product, quantity = operation.values()
 
+        # Perform the operation `quantity` times
+        for _ in range(quantity):
+            if type_ == 'add':
+                # Wait until the Marketplace signals that the `Consumer` can add to cart
+                result = self.marketplace.add_to_cart(cart_id, product)
+                while not result:
+                    self.waiting_for = product
+                    # Honor the retry-after hint of the admission control, if any
+                    yield max(self.retry_wait_time, getattr(result, 'retry_after', 0))
+                    result = self.marketplace.add_to_cart(cart_id, product)
+                self.waiting_for = None
+            elif type_ == 'add_any':
+                # Reserve the first available alternative, in the order of preference
+                result = self.marketplace.add_any_to_cart(cart_id, product)
+                while not result:
+                    self.waiting_for = product
+                    yield max(self.retry_wait_time, getattr(result, 'retry_after', 0))
+                    result = self.marketplace.add_any_to_cart(cart_id, product)
+                self.waiting_for = None
+            elif type_ == 'remove':
+                self.marketplace.remove_from_cart(cart_id, product)
+
+    def shop(self):
+        """
+        Performs all the carts of the consumer. Yields the number of seconds to wait
+        every time the consumer can't make progress, so that the caller decides
+        how to wait (sleep on the thread or hand the worker to another consumer).
+        """
+        # The calls of the consumer are recorded as a single stream (see recorder.py);
+        # a pool that resumes the consumer on another worker sets it there too
+        set_caller(self.name)
         for cart in self.carts:
             # Create a new `cart_id`
             cart_id = self.marketplace.new_cart()
 
             # Perform all operations on the cart
-            _ = [perform_op(op) for op in cart]
+            for operation in cart:
+                yield from self.perform_op(cart_id, operation)
 
             # After all operations are performed, the `Consumer` checks out
+            if self.product_ids is not None:
+                self.receipts.update(self.marketplace.place_order(cart_id, receipt=True))
+                continue
             products = self.marketplace.place_order(cart_id)
 
             # Print the products in the cart
             for product in products:
                 with self.print_lock:
                     print(f'{self.name} bought {product}', flush=True)
+
+        # Print the receipts, once all the carts are ordered,
+        # in a single write so that they don't interleave with other consumers' output
+        if self.receipts:
+            lines = [format_receipt(self.name, self.product_ids[product], count) + '\n'
+                     for product, count in self.receipts.items()]
+            with self.print_lock:
+                print(''.join(lines), end='', flush=True)
+
+    def run(self):
+        with PROFILER.profile('consumer'):
+            for wait_time in self.shop():
+                with TRACER.span('sleep', 'consumer'):
+                    sleep(wait_time)
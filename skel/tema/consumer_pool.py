@@ -0,0 +1,112 @@
+"""
+This module represents the ConsumerPool.
+"""
+
+import heapq
+import sys
+import traceback
+from itertools import count
+from threading import Thread, Condition
+from time import monotonic
+try:
+    from .profiler import PROFILER
+except ImportError:
+    from profiler import PROFILER
+try:
+    from .recorder import set_caller
+except ImportError:
+    from recorder import set_caller
+
+class ConsumerPool:
+    """
+    Class that runs many logical consumers on a bounded number of worker threads.
+    A consumer that can't make progress gives its worker back to the pool
+    instead of sleeping on it, and it is resumed once its retry time is due.
+    """
+
+    def __init__(self, consumers, num_workers):
+        """
+        Constructor.
+
+        :type consumers: List
+        :param consumers: the consumers to run (anything that has a `shop()` generator)
+
+        :type num_workers: Int
+        :param num_workers: the number of worker threads
+        """
+        self.num_workers = num_workers # Number of worker threads
+        self.tasks = [] # Heap of (ready_time, seq, consumer name, task)
+        self.seq = count() # Tie breaker, so that tasks are never compared
+        self.pending = 0 # Number of consumers that haven't finished yet
+        self.condition = Condition() # Guards `tasks` and `pending`
+
+        now = monotonic()
+        for consumer in consumers:
+            self.tasks.append((now, next(self.seq), getattr(consumer, 'name', None),
+                               consumer.shop()))
+            self.pending += 1
+        heapq.heapify(self.tasks)
+
+    def _next_task(self):
+        """
+        Returns the (consumer name, task) that is due or None if all the consumers finished.
+        """
+        with self.condition:
+            while True:
+                if not self.pending:
+                    return None
+
+                if self.tasks:
+                    delay = self.tasks[0][0] - monotonic()
+                    if delay <= 0:
+                        return heapq.heappop(self.tasks)[2:]
+                    self.condition.wait(delay)
+                else:
+                    # Every remaining task is running on another worker
+                    self.condition.wait()
+
+    def _work(self):
+        """
+        Runs tasks until all the consumers finished.
+        """
+        with PROFILER.profile('consumer'):
+            self._run_tasks()
+
+    def _run_tasks(self):
+        while True:
+            due = self._next_task()
+            if due is None:
+                return
+            name, task = due
+
+            # Run the consumer until it blocks or finishes. A consumer that fails is retired
+            # like a finished one, otherwise the other workers would wait for it forever
+            try:
+                # The worker makes the calls of this consumer until it blocks
+                set_caller(name)
+                wait_time = next(task)
+            except Exception as error: # pylint: disable=broad-except
+                if not isinstance(error, StopIteration):
+                    print('ConsumerPool: a consumer failed and was retired', file=sys.stderr)
+                    traceback.print_exc()
+                with self.condition:
+                    self.pending -= 1
+                    self.condition.notify_all()
+                continue
+
+            with self.condition:
+                heapq.heappush(self.tasks, (monotonic() + wait_time, next(self.seq), name, task))
+                self.condition.notify()
+
+    def run(self):
+        """
+        Starts the workers and waits until all the consumers finished.
+        """
+        workers = [Thread(target=self._work, name=f'consumer-worker-{i}')
+                   for i in range(self.num_workers)]
+
+        for worker in workers:
+            worker.start()
+
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,84 @@
+"""
+This module represents the EventLog.
+"""
+
+from threading import Lock
+from time import perf_counter
+
+import numpy as np
+
+class EventLog:
+    """
+    Class that records the Marketplace events as compact numeric records,
+    appended to a preallocated NumPy structured array that grows by doubling.
+    Products are interned to integer IDs.
+    """
+
+    OPS = ('publish', 'publish_rejected', 'add', 'add_failed', 'remove', 'new_cart', 'order')
+    DTYPE = np.dtype([('op', 'u1'), ('time', 'f8'), ('producer', 'i4'),
+                      ('product', 'i4'), ('cart', 'i4')])
+
+    def __init__(self, capacity=1 << 16):
+        """
+        Constructor
+
+        :type capacity: Int
+        :param capacity: the number of records preallocated
+        """
+        self.records = np.empty(capacity, dtype=self.DTYPE)
+        self.size = 0 # Number of records
+        self.op_codes = {op: code for code, op in enumerate(self.OPS)}
+        self.products = [] # The products, indexed by their ID
+        self.product_ids = {} # {product: product ID}
+        self.start = perf_counter() # Time 0 of the records
+        self.lock = Lock() # Lock for appending records
+
+    def record(self, op, product=None, producer_id=-1, cart_id=-1):
+        """
+        Appends an event.
+
+        :type op: String
+        :param op: one of `EventLog.OPS`
+
+        :type product: Product
+        :param product: the product of the event, if any
+
+        :type producer_id: Int
+        :param producer_id: the producer of the event, or -1
+
+        :type cart_id: Int
+        :param cart_id: the cart of the event, or -1
+        """
+        timestamp = perf_counter() - self.start
+        with self.lock:
+            if product is None:
+                product_id = -1
+            elif product in self.product_ids:
+                product_id = self.product_ids[product]
+            else:
+                product_id = self.product_ids[product] = len(self.products)
+                self.products.append(product)
+
+            if self.size == len(self.records):
+                self.records = np.resize(self.records, 2 * len(self.records))
+            self.records[self.size] = (self.op_codes[op], timestamp,
+                                       producer_id, product_id, cart_id)
+            self.size += 1
+
+    def events(self):
+        """
+        Returns a copy of the recorded events.
+
+        :rtype: numpy.ndarray
+        :return: the events, as a structured array of `EventLog.DTYPE`
+        """
+        with self.lock:
+            return self.records[:self.size].copy()
+
+    def save(self, filename):
+        """
+        Saves the events and the product names to a `.npz` file.
+        """
+        np.savez_compressed(filename, events=self.events(),
+                            products=np.array([repr(product) for product in self.products]),
+                            ops=np.array(self.OPS))
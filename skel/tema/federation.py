@@ -0,0 +1,414 @@
+"""
+This module represents the MarketplaceFederation.
+"""
+
+from threading import Lock
+from time import monotonic
+try:
+    from .marketplace import Marketplace
+except ImportError:
+    from marketplace import Marketplace
+try:
+    from .cart import Cart
+except ImportError:
+    from cart import Cart
+
+class MarketplaceFederation:
+    """
+    Class that partitions the producers and their products across K Marketplace shards,
+    each with its own locks, behind the same public API as the Marketplace.
+        - `publish()` is routed to the producer's shard
+        - `add_to_cart()` tries the product's home shard first (the shard it was last
+          published to), then steals from the others
+        - a cart can hold products from any shard, under the same cart id in every shard
+    """
+
+    def __init__(self, queue_size_per_producer, num_shards=4, **kwargs):
+        """
+        Constructor
+
+        :type queue_size_per_producer: Int
+        :param queue_size_per_producer: the maximum size of a queue associated with each producer
+
+        :type num_shards: Int
+        :param num_shards: the number of Marketplace shards
+
+        :type kwargs:
+        :param kwargs: other arguments that are passed to every shard's __init__()
+        """
+        self.shards = [Marketplace(queue_size_per_producer, **kwargs) for _ in range(num_shards)]
+        self.event_log = kwargs.get('event_log') # Shared with the shards (or None)
+
+        self.product_homes = {} # {product: index of the shard it was last published to}
+
+        self.num_producers = 0 # Number of producers registered
+        self.carts = {} # {cart_id: Cart()}, the products of the cart from all the shards
+        self.shard_carts = {} # {cart_id: {shard index: shard cart_id (the same cart_id)}}
+        self.num_carts = 0 # Number of carts in the federation
+
+        self.num_orders = 0 # Number of orders placed
+        self.order_time = 0 # Total time from the creation of the carts to their orders
+
+        self.register_producer_lock = Lock() # Lock for `register_producer()` method
+        self.new_cart_lock = Lock() # Lock for `new_cart()` method
+        self.place_order_lock = Lock() # Lock for the order statistics of `place_order()`
+
+    def producer_shard(self, producer_id):
+        """
+        Returns the index of the shard the producer publishes to.
+        """
+        return producer_id % len(self.shards)
+
+    def product_shard(self, product):
+        """
+        Returns the index of the product's home shard: the shard its producers published
+        the most available units to (read without any lock), or the shard of the producer
+        that published it last, if none is available.
+        """
+        home = self.product_homes.get(product, 0)
+        best = self.shards[home].available(product)
+        for index, shard in enumerate(self.shards):
+            available = shard.available(product)
+            if available > best:
+                home, best = index, available
+
+        return home
+
+    @property
+    def queue_size_per_producer(self):
+        """
+        Returns the maximum size of a queue associated with each producer.
+        """
+        return self.shards[0].queue_size_per_producer
+
+    @queue_size_per_producer.setter
+    def queue_size_per_producer(self, queue_size_per_producer):
+        for shard in self.shards:
+            shard.queue_size_per_producer = queue_size_per_producer
+
+    @property
+    def stats(self):
+        """
+        Returns the running totals of the outcomes of all the shards.
+        """
+        stats = dict.fromkeys(self.shards[0].stats, 0)
+        for shard in self.shards:
+            for key, value in shard.stats.items():
+                stats[key] += value
+        # The shards' carts are parts of the federation's carts
+        stats['orders'] = self.num_orders
+        stats['order_time'] = self.order_time
+
+        return stats
+
+    @property
+    def products(self):
+        """
+        Returns the stock of all the shards, as {product: [producer_id, ...]}.
+        """
+        products = {}
+        for shard in self.shards:
+            for product, producer_ids in list(shard.products.items()):
+                products.setdefault(product, []).extend(producer_ids)
+
+        return products
+
+    @property
+    def producer_num_products(self):
+        """
+        Returns the number of products of every producer, as {producer_id: num_products}.
+        """
+        producer_num_products = {}
+        for shard in self.shards:
+            producer_num_products.update(shard.producer_num_products)
+
+        return producer_num_products
+
+    @property
+    def progress(self):
+        """
+        Returns the number of operations that changed the stock of any shard.
+        """
+        return sum(shard.progress for shard in self.shards)
+
+    def stock_by_producer(self):
+        """
+        Returns the available units of every producer, as {producer_id: {product: units}}.
+        """
+        stock = {}
+        for shard in self.shards:
+            stock.update(shard.stock_by_producer())
+
+        return stock
+
+    def discard(self, producer_id, product):
+        """
+        Discards an available unit of a product published by the given producer.
+        """
+        return self.shards[self.producer_shard(producer_id)].discard(producer_id, product)
+
+    def snapshot(self):
+        """
+        Returns the latest inventory snapshot of every shard, without waiting for
+        any lock. Every shard's snapshot is consistent, but they may be from
+        slightly different times.
+
+        :rtype: List
+        :return: the InventorySnapshot of every shard
+        """
+        return [shard.snapshot() for shard in self.shards]
+
+    def available(self, product):
+        """
+        Returns the number of available units of a product in all the shards.
+        """
+        return sum(shard.available(product) for shard in self.shards)
+
+    def producer_load(self, producer_id):
+        """
+        Returns the number of products of a producer in the marketplace.
+        """
+        return self.shards[self.producer_shard(producer_id)].producer_load(producer_id)
+
+    def demand(self, product):
+        """
+        Returns the number of carts waiting for a product in all the shards. A cart has the
+        same id in every shard, so one that waits in several shards is counted once.
+        The union of the sets of ids runs in C, without releasing the GIL, so it needs no lock.
+        """
+        return len(set().union(*[shard.waiting.get(product, ()) for shard in self.shards]))
+
+    def next_demanded(self, producer_id, products=None):
+        """
+        Returns the product a producer should publish next: the one with the highest demand
+        that is not met by the available units of all the shards.
+
+        :returns the product or None, if none of the products is in demand
+        """
+        if products is None:
+            shard = self.shards[self.producer_shard(producer_id)]
+            products = shard.producer_catalogs.get(producer_id, ())
+
+        best, best_demand = None, 0
+        for product in products:
+            unmet = self.demand(product) - self.available(product)
+            if unmet > best_demand:
+                best, best_demand = product, unmet
+
+        return best
+
+    def _served(self, cart_id, product):
+        """
+        Records in every shard that a cart doesn't wait for a product anymore.
+        The waiting carts are checked without the lock first, since it's rarely needed.
+        """
+        for index, shard_cart_id in self.shard_carts[cart_id].items():
+            if shard_cart_id in self.shards[index].waiting.get(product, ()):
+                self.shards[index].stop_waiting(shard_cart_id, product)
+
+    def register_producer(self):
+        """
+        Returns an id for the producer that calls this.
+        """
+        with self.register_producer_lock:
+            producer_id = self.num_producers
+            self.num_producers += 1
+
+        return producer_id
+
+    def publish(self, producer_id, product):
+        """
+        Adds the product provided by the producer to the producer's shard.
+
+        :returns True or False. If the caller receives False, it should wait and then try again.
+        """
+        producer_id = int(producer_id)
+        index = self.producer_shard(producer_id)
+        published = self.shards[index].publish(producer_id, product)
+        if published:
+            self.product_homes[product] = index
+
+        return published
+
+    def new_cart(self):
+        """
+        Creates a new cart for the consumer. The shards' carts are created on demand.
+
+        :returns an int representing the cart_id
+        """
+        with self.new_cart_lock:
+            self.num_carts += 1
+            cart_id = self.num_carts
+            self.carts[cart_id] = Cart()
+            self.shard_carts[cart_id] = {}
+
+        if self.event_log is not None:
+            self.event_log.record('new_cart', cart_id=cart_id)
+
+        return cart_id
+
+    def cart(self, cart_id):
+        """
+        Returns the federation's cart with the given id, or None if it's not created yet.
+        """
+        return self.carts.get(cart_id)
+
+    def _shard_cart(self, cart_id, index):
+        """
+        Returns the id of the cart's cart in a shard, creating it if needed.
+        A cart is only used by one consumer, so this needs no lock.
+        """
+        shard_carts = self.shard_carts[cart_id]
+        if index not in shard_carts:
+            shard_carts[index] = self.shards[index].new_cart(cart_id)
+
+        return shard_carts[index]
+
+    def add_to_cart(self, cart_id, product):
+        """
+        Adds a product to the given cart, from the product's home shard
+        or, if it's out of stock there, from any other shard.
+
+        :returns True or False. If the caller receives False, it should wait and then try again
+        """
+        if cart_id not in self.carts:
+            return False
+
+        home = self.product_shard(product)
+        result = False
+        for offset in range(len(self.shards)):
+            index = (home + offset) % len(self.shards)
+            shard = self.shards[index]
+            # Don't create a cart in a shard that doesn't have the product
+            if offset and not shard.available(product):
+                continue
+
+            shard_cart_id = self._shard_cart(cart_id, index)
+            reserved = shard.add_to_cart(shard_cart_id, product)
+            if reserved:
+                producer_id = shard.carts[shard_cart_id].products[-1]['producer_id']
+                self.carts[cart_id].add_product(product, producer_id)
+                # The cart may be waiting for the product in the shards it failed in
+                self._served(cart_id, product)
+                return True
+
+            # Keep the home shard's answer (it may carry a retry-after hint)
+            if not offset:
+                result = reserved
+
+        return result
+
+    def add_any_to_cart(self, cart_id, products):
+        """
+        Adds to the given cart the first of the alternative products that is available
+        in any shard. Every reservation is atomic within its shard.
+
+        :returns the product added to the cart or False
+        """
+        result = False
+        for product in products:
+            reserved = self.add_to_cart(cart_id, product)
+            if reserved:
+                # The cart doesn't wait for the other alternatives anymore
+                for alternative in products:
+                    self._served(cart_id, alternative)
+                return product
+            # Keep the answer for the preferred product (it may carry a retry-after hint)
+            if product is products[0]:
+                result = reserved
+
+        return result
+
+    def remove_from_cart(self, cart_id, product):
+        """
+        Removes a product from cart, giving it back to the shard it came from.
+        """
+        if cart_id not in self.carts:
+            return False
+
+        # The first unit of the product in the cart comes from its producer's shard,
+        # where it's also the first unit of the product in the shard's cart
+        producer_id = next((item['producer_id'] for item in self.carts[cart_id].products
+                            if item['product'] == product), None)
+        if producer_id is None:
+            return False
+
+        index = self.producer_shard(producer_id)
+        if not self.shards[index].remove_from_cart(self.shard_carts[cart_id][index], product):
+            return False
+        self.carts[cart_id].remove_product(product)
+
+        return True
+
+    def place_order(self, cart_id, summary=False, receipt=False):
+        """
+        Return a list with all the products in the cart, its OrderSummary or its receipt.
+        """
+        if cart_id not in self.carts:
+            return False
+
+        for index, shard_cart_id in self.shard_carts[cart_id].items():
+            self.shards[index].place_order(shard_cart_id, summary=True)
+        with self.place_order_lock:
+            self.num_orders += 1
+            self.order_time += monotonic() - self.carts[cart_id].created
+
+        if summary:
+            return self.carts[cart_id].summary()
+        if receipt:
+            return self.carts[cart_id].receipt()
+
+        return self.carts[cart_id].get_products()
+
+    def subscribe(self):
+        """
+        Subscribes to the events of all the shards.
+        """
+        return FederatedSubscription([shard.subscribe() for shard in self.shards])
+
+
+class FederatedSubscription:
+    """
+    Class that merges the subscriptions to every shard, ordering the events by time.
+    """
+
+    def __init__(self, subscriptions):
+        """
+        Constructor
+        """
+        self.subscriptions = subscriptions
+
+    def poll(self, max_events=None):
+        """
+        Returns the available events of all the shards, without blocking.
+        """
+        events = []
+        for subscription in self.subscriptions:
+            if max_events is None:
+                events += subscription.poll()
+            elif len(events) < max_events:
+                events += subscription.poll(max_events - len(events))
+        events.sort(key=lambda event: event.time)
+
+        return events
+
+    @property
+    def dropped(self):
+        """
+        Returns the number of events dropped by all the shards' subscriptions.
+        """
+        return sum(subscription.dropped for subscription in self.subscriptions)
+
+    def __iter__(self):
+        while True:
+            events = self.poll(64)
+            if not events:
+                return
+            yield from events
+
+    def close(self):
+        """
+        Unsubscribes from all the shards.
+        """
+        for subscription in self.subscriptions:
+            subscription.close()
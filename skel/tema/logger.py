@@ -22,13 +22,17 @@ class Logger:
         self.logger = logging.getLogger(name)
         self.logger.propagate = False
 
-        self.handler = logging.handlers.RotatingFileHandler('marketplace.log',
-                                                            mode='w',
-                                                            maxBytes=1*1024*1024,
-                                                            backupCount=5)
-        self.handler.setFormatter(
-            logging.Formatter('[%(asctime)s] %(message)s', '%Y-%m-%d %H:%M:%S'))
-        self.logger.addHandler(self.handler)
+        # Loggers are shared by name, so the file handler is only added once
+        # (e.g. for the shards of a MarketplaceFederation)
+        if not self.logger.handlers:
+            handler = logging.handlers.RotatingFileHandler('marketplace.log',
+                                                           mode='w',
+                                                           maxBytes=1*1024*1024,
+                                                           backupCount=5)
+            handler.setFormatter(
+                logging.Formatter('[%(asctime)s] %(message)s', '%Y-%m-%d %H:%M:%S'))
+            self.logger.addHandler(handler)
+        self.handler = self.logger.handlers[0]
         self.logger.setLevel(logging.INFO)
         logging.Formatter.converter = time.gmtime
 
@@ -3,15 +3,36 @@ This module represents the Marketplace.
 """
 
 # The `try-except` blocks are used to support both `unit testing` and `functional testing`
-from threading import Lock
+from collections import deque
+from time import monotonic
 try:
     from .logger import Logger
 except ImportError:
     from logger import Logger
+try:
+    from .tracer import TRACER, traced
+except ImportError:
+    from tracer import TRACER, traced
+try:
+    from .change_feed import ChangeFeed
+except ImportError:
+    from change_feed import ChangeFeed
 try:
     from .cart import Cart
 except ImportError:
     from cart import Cart
+try:
+    from .quota import QuotaExceeded
+except ImportError:
+    from quota import QuotaExceeded
+try:
+    from .snapshot import InventorySnapshot
+except ImportError:
+    from snapshot import InventorySnapshot
+try:
+    from .combining import FlatCombiner
+except ImportError:
+    from combining import FlatCombiner
 
 class Marketplace:
     """
@@ -19,32 +40,221 @@ class Marketplace:
     The producers and consumers use its methods concurrently.
     """
 
-    def __init__(self, queue_size_per_producer):
+    def __init__(self, queue_size_per_producer, event_log=None, admission=None, quota=None,
+                 combining=False, snapshot_interval=64):
         """
         Constructor
 
         :type queue_size_per_producer: Int
         :param queue_size_per_producer: the maximum size of a queue associated with each producer
+
+        :type event_log: EventLog
+        :param event_log: optional log that records every event as a numeric record
+
+        :type admission: AdmissionController
+        :param admission: optional admission control for the `add_to_cart()` retries
+
+        :type quota: ProductQuota
+        :param quota: optional cap on the slots a product can take in a producer's queue
+
+        :type combining: Boolean
+        :param combining: apply the contended reservations and returns of a product in batches
+
+        :type snapshot_interval: Int
+        :param snapshot_interval: the number of stock changes after which the writers publish
+        the next inventory snapshot (sooner if a reader finds the latest one stale)
         """
         self.queue_size_per_producer = queue_size_per_producer # Maximum queue size per producer
 
         self.producers = [] # List of producer IDs
-        self.products = [] # List of products in the marketplace
+
+        # {product: deque([producer_id, ...])}, one producer ID for each available unit.
+        # Equal products can be published by different producers, so every unit
+        # keeps track of its own producer (the inverse mapping product -> producer_id)
+        self.products = {}
 
         self.producer_num_products = {} # {producer_id: num_products}
-        self.product_to_producer = {} # {product: producer_id} (inverse mapping)
+        self.producer_catalogs = {} # {producer_id: set of the products it published}
+
+        # {product: set of cart_ids}, the carts that failed to reserve a product
+        # and are still waiting for it: the product's unmet demand
+        self.waiting = {}
+
+        self.version = 0 # Number of changes of the stock
+        # Immutable view of the stock, replaced (never modified) at most once every
+        # `snapshot_interval` changes or once per reader that found it stale,
+        # so that the readers of snapshots never wait for the lock
+        self.inventory = InventorySnapshot(0, {}, {}, queue_size_per_producer)
+        self.snapshot_interval = snapshot_interval
+        self.changed_products = set() # Products changed since the latest snapshot
+        self.changed_producers = set() # Producers whose load changed since then
+        self.snapshot_wanted = False # Set by a reader that found the latest snapshot stale
 
         self.carts = {} # {cart_id: Cart()}
         self.num_carts = 0 # Number of carts in the marketplace
 
-        self.register_producer_lock = Lock() # Lock for `register_producer()` method
-        self.new_cart_lock = Lock() # Lock for `new_cart()` method
-        self.add_to_cart_lock = Lock() # Lock for `add_to_cart()` method
+        # The locks record their waits when tracing is enabled
+        self.register_producer_lock = TRACER.lock('register_producer_lock') # `register_producer()`
+        self.new_cart_lock = TRACER.lock('new_cart_lock') # Lock for `new_cart()` method
+        self.add_to_cart_lock = TRACER.lock('add_to_cart_lock') # Lock for the stock
+        # Batches the contended `add_to_cart()` / `remove_from_cart()` calls per product
+        self.combiner = FlatCombiner(self.add_to_cart_lock) if combining else None
+
+        self.event_log = event_log # Numeric event records, for analytics (or None)
+        self.feed = ChangeFeed() # Structured events, for the subscribers
+        self.admission = admission # Sheds the `add_to_cart()` retries (or None)
+        self.quota = quota # Per-(producer, product) slot quota (or None)
+        self.progress = 0 # Number of operations that changed the stock, for the watchdog
+        # Running totals of the outcomes, for the auto-tuner
+        self.stats = dict.fromkeys(('published', 'publish_rejected', 'reserved', 'add_failed',
+                                    'orders', 'order_time'), 0)
 
         self.logger = Logger(__name__) # Logger
         # Logger.disable()
         self.logger.log('Marketplace created')
 
+    def subscribe(self):
+        """
+        Subscribes to the marketplace events: 'published', 'reserved', 'returned',
+        'order_placed' and 'wanted' (a cart started waiting for a product).
+        Reading the events never blocks the marketplace: a slow subscriber lags behind
+        and drops the events that were overwritten.
+
+        :rtype: Subscription
+        :return: the subscription, with `poll()` and an iterator over the available events
+        """
+        return self.feed.subscribe()
+
+    def snapshot(self):
+        """
+        Returns the latest inventory snapshot, without ever waiting for the lock.
+        If it's stale, the reader publishes the next one itself when the lock is free;
+        otherwise it asks the writer that holds the lock to publish it on its next change
+        and returns the latest one, which only misses the changes in flight.
+
+        :rtype: InventorySnapshot
+        :return: an immutable, consistent view of the stock
+        """
+        inventory = self.inventory
+        if inventory.version == self.version:
+            return inventory
+
+        self.snapshot_wanted = True
+        if self.add_to_cart_lock.acquire(False):
+            try:
+                self._publish_snapshot()
+            finally:
+                self.add_to_cart_lock.release()
+
+        return self.inventory
+
+    def available(self, product):
+        """
+        Returns the number of available units of a product, without taking any lock:
+        getting the units of a product and their number are both atomic.
+        """
+        producer_ids = self.products.get(product)
+        return len(producer_ids) if producer_ids else 0
+
+    def producer_load(self, producer_id):
+        """
+        Returns the number of products of a producer in the marketplace,
+        without taking any lock.
+        """
+        return self.producer_num_products.get(producer_id, 0)
+
+    def demand(self, product):
+        """
+        Returns the number of carts waiting for a product, without taking any lock.
+        """
+        return len(self.waiting.get(product, ()))
+
+    def next_demanded(self, producer_id, products=None):
+        """
+        Returns the product a producer should publish next: the one with the highest demand
+        that is not met by the available units. Reads the counters without taking any lock,
+        so the answer is only a hint.
+
+        :type producer_id: Int
+        :param producer_id: producer id
+
+        :type products: List
+        :param products: the products the producer can publish
+            (by default, the products it published so far)
+
+        :returns the product or None, if none of the products is in demand
+        """
+        if products is None:
+            products = self.producer_catalogs.get(producer_id, ())
+
+        best, best_demand = None, 0
+        for product in products:
+            unmet = self.demand(product) - self.available(product)
+            if unmet > best_demand:
+                best, best_demand = product, unmet
+
+        return best
+
+    def _wait(self, cart_id, product):
+        """
+        Records that a cart failed to reserve a product and waits for it.
+        The caller must hold `add_to_cart_lock`.
+        """
+        carts = self.waiting.setdefault(product, set())
+        if cart_id not in carts:
+            carts.add(cart_id)
+            self.feed.emit('wanted', product, cart_id=cart_id)
+
+    def stop_waiting(self, cart_id, product):
+        """
+        Records that a cart doesn't wait for a product anymore.
+        """
+        with self.add_to_cart_lock:
+            self._served(cart_id, product)
+
+    def _served(self, cart_id, product):
+        """
+        Records that a cart doesn't wait for a product anymore.
+        The caller must hold `add_to_cart_lock`.
+        """
+        carts = self.waiting.get(product)
+        if carts is not None and cart_id in carts:
+            carts.discard(cart_id)
+            if not carts:
+                del self.waiting[product]
+
+    def _changed(self, product, producer_id):
+        """
+        Counts a change of the stock of a product from a producer and publishes the next
+        inventory snapshot every `snapshot_interval` changes, or right away if a reader
+        asked for it. The caller must hold `add_to_cart_lock`.
+        """
+        self.version += 1
+        self.changed_products.add(product)
+        self.changed_producers.add(producer_id)
+        if self.snapshot_wanted or \
+                self.version - self.inventory.version >= self.snapshot_interval:
+            self._publish_snapshot()
+
+    def _publish_snapshot(self):
+        """
+        Publishes the next inventory snapshot: a copy of the latest one, with the changed
+        products and producers applied. The caller must hold `add_to_cart_lock`.
+        """
+        self.snapshot_wanted = False
+        if self.inventory.version == self.version:
+            return
+
+        self.inventory = self.inventory.updated(
+            self.version,
+            {product: len(self.products.get(product, ())) for product in self.changed_products},
+            {producer_id: self.producer_num_products[producer_id]
+             for producer_id in self.changed_producers},
+            self.queue_size_per_producer)
+        self.changed_products.clear()
+        self.changed_producers.clear()
+
+    @traced('marketplace')
     def register_producer(self):
         """
         Returns an id for the producer that calls this.
@@ -58,6 +268,7 @@ class Marketplace:
 
         return producer_id
 
+    @traced('marketplace')
     def publish(self, producer_id, product):
         """
         Adds the product provided by the producer to the marketplace
@@ -69,50 +280,94 @@ class Marketplace:
         :param product: the Product that will be published in the Marketplace
 
         :returns True or False. If the caller receives False, it should wait and then try again.
+            With a quota, a falsy `QuotaExceeded` means that the producer should publish
+            its other products first.
         """
         # Log the input parameters
         self.logger.log(f'[?] Producer {producer_id} is trying to publish {product}')
 
-        # Check if the producer has reached the maximum number of products
         producer_id = int(producer_id)
-        producer_curr_products = self.producer_num_products.get(producer_id, 0)
-        if producer_curr_products >= self.queue_size_per_producer:
-            self.logger.log(f'[X] Producer {producer_id} reached '
-                f'the maximum number of products {self.queue_size_per_producer}')
-            return False
-
-        # Increment the number of products for the producer
-        self.producer_num_products[producer_id] = producer_curr_products + 1
-
-        # Add the product to the marketplace `products` list
-        self.products.append(product)
+        with self.add_to_cart_lock:
+            # Check if the producer has reached the maximum number of products
+            producer_curr_products = self.producer_num_products.get(producer_id, 0)
+            if producer_curr_products >= self.queue_size_per_producer:
+                self.logger.log(f'[X] Producer {producer_id} reached '
+                    f'the maximum number of products {self.queue_size_per_producer}')
+                self.stats['publish_rejected'] += 1
+                if self.event_log is not None:
+                    self.event_log.record('publish_rejected', product, producer_id)
+                return False
 
-        # Also perform the inverse mapping from product -> producer_id
-        self.product_to_producer[product] = producer_id
+            # Keep some slots of the queue for the producer's other products
+            if self.quota is not None:
+                if not self.quota.allows(producer_id, product):
+                    self.logger.log(f'[X] Producer {producer_id} reached the quota of {product}')
+                    self.stats['publish_rejected'] += 1
+                    if self.event_log is not None:
+                        self.event_log.record('publish_rejected', product, producer_id)
+                    return QuotaExceeded()
+                self.quota.taken(producer_id, product)
+
+            # Increment the number of products for the producer
+            self.producer_num_products[producer_id] = producer_curr_products + 1
+
+            # Add the product to the marketplace, remembering its producer
+            self.products.setdefault(product, deque()).append(producer_id)
+            self.producer_catalogs.setdefault(producer_id, set()).add(product)
+            self._changed(product, producer_id)
+
+            self.progress += 1
+            self.stats['published'] += 1
+            if self.event_log is not None:
+                self.event_log.record('publish', product, producer_id)
+            self.feed.emit('published', product, producer_id)
 
         self.logger.log(f'[W] Producer {producer_id} successfully published {product}')
 
         return True
 
-    def new_cart(self):
+    @traced('marketplace')
+    def new_cart(self, cart_id=None):
         """
         Creates a new cart for the consumer
 
+        :type cart_id: Int
+        :param cart_id: the id of the cart, if it's assigned by the caller: a federation
+        gives its shards' carts the federation's cart ids, so that the admission control,
+        the event log and the waiting carts it shares with them see one id per cart
+
         :returns an int representing the cart_id
         """
+        assigned = cart_id is not None
         with self.new_cart_lock:
             self.logger.log('[?] Creating a new cart')
-            # Increase the number of carts
-            self.num_carts += 1
+            if not assigned:
+                # Increase the number of carts
+                self.num_carts += 1
+                cart_id = self.num_carts
 
             # Create a new cart
-            self.carts[self.num_carts] = Cart()
+            self.carts[cart_id] = Cart()
+
+            self.logger.log(f'[W] Cart {cart_id} created')
 
-            self.logger.log(f'[W] Cart {self.num_carts} created')
+        # The caller that assigns the id records the cart once
+        if self.event_log is not None and not assigned:
+            self.event_log.record('new_cart', cart_id=cart_id)
 
         # Return the cart id
-        return self.num_carts
+        return cart_id
 
+    def cart(self, cart_id):
+        """
+        Returns the cart with the given id, or None if it's not created yet.
+        Getting an entry of `carts` is atomic, so this takes no lock.
+
+        :rtype: Cart
+        """
+        return self.carts.get(cart_id)
+
+    @traced('marketplace')
     def add_to_cart(self, cart_id, product):
         """
         Adds a product to the given cart. The method returns
@@ -123,40 +378,175 @@ class Marketplace:
         :type product: Product
         :param product: the product to add to cart
 
-        :returns True or False. If the caller receives False, it should wait and then try again
+        :returns True or False. If the caller receives False, it should wait and then try again.
+        If the admission control rejects the attempt, the falsy result has a `retry_after` hint
         """
+        # Shed the retries on products that look out of stock, without taking the lock
+        if self.admission is not None and not self.available(product):
+            rejection = self.admission.admit(cart_id, product)
+            if rejection is not None:
+                self.logger.log(f'[X] Adding {product} to cart {cart_id} {rejection}')
+                return rejection
+
+        if self.combiner is not None:
+            return self.combiner.submit(product, self._add, cart_id, product)
 
         with self.add_to_cart_lock:
-            # Log the input parameters
-            self.logger.log(f'[?] Adding {product} to cart {cart_id}')
+            return self._add(cart_id, product)
 
-            # Check if the product is in the marketplace
-            if product not in self.products:
-                self.logger.log(f'[X] Product {product} not in marketplace')
-                return False
+    def _add(self, cart_id, product):
+        """
+        Adds a product to the given cart, if it's available.
+        The caller must hold `add_to_cart_lock`.
+        """
+        # Log the input parameters
+        self.logger.log(f'[?] Adding {product} to cart {cart_id}')
+
+        # Check if the product is in the marketplace
+        if product not in self.products:
+            self.logger.log(f'[X] Product {product} not in marketplace')
+            self.stats['add_failed'] += 1
+            if self.event_log is not None:
+                self.event_log.record('add_failed', product, cart_id=cart_id)
+            if self.admission is not None:
+                self.admission.failed(cart_id)
+            self._wait(cart_id, product)
+            return False
+
+        # Check if the cart is created
+        if cart_id not in self.carts:
+            self.logger.log(f'[X] Cart {cart_id} not created yet')
+            return False
+
+        self._reserve(cart_id, product)
+
+        return True
+
+    @traced('marketplace')
+    def add_any_to_cart(self, cart_id, products):
+        """
+        Adds to the given cart the first of the alternative products that is available.
+        The alternatives are checked and the product is reserved atomically.
+
+        :type cart_id: Int
+        :param cart_id: id cart
+
+        :type products: List
+        :param products: the acceptable products, in the order of preference
+
+        :returns the product added to the cart or False. If the caller receives False,
+        it should wait and then try again (the falsy result may have a `retry_after` hint)
+        """
+        # Shed the retries when all the alternatives look out of stock
+        if self.admission is not None and not any(product in self.products
+                                                  for product in products):
+            rejection = self.admission.admit(cart_id, products[0])
+            if rejection is not None:
+                self.logger.log(f'[X] Adding any of {products} to cart {cart_id} {rejection}')
+                return rejection
+
+        with self.add_to_cart_lock:
+            # Log the input parameters
+            self.logger.log(f'[?] Adding any of {products} to cart {cart_id}')
 
             # Check if the cart is created
             if cart_id not in self.carts:
                 self.logger.log(f'[X] Cart {cart_id} not created yet')
                 return False
 
-            # Get the producer id for the product
-            producer_id = self.product_to_producer[product]
+            # Pick the first alternative that is in the marketplace
+            product = next((product for product in products if product in self.products), None)
+            if product is None:
+                self.logger.log(f'[X] None of {products} in marketplace')
+                self.stats['add_failed'] += 1
+                if self.event_log is not None:
+                    self.event_log.record('add_failed', products[0], cart_id=cart_id)
+                if self.admission is not None:
+                    self.admission.failed(cart_id)
+                for alternative in products:
+                    self._wait(cart_id, alternative)
+                return False
 
-            # Decrease the number of products for the producer
-            self.producer_num_products[producer_id] -= 1
+            self._reserve(cart_id, product)
+            for alternative in products:
+                self._served(cart_id, alternative)
 
-            # Add the product to the cart
-            self.carts[cart_id].add_product(product, producer_id)
+        return product
 
-            # Remove the product from the marketplace
-            self.products.remove(product)
+    def _reserve(self, cart_id, product):
+        """
+        Moves the oldest unit of an available product to the cart.
+        The caller must hold `add_to_cart_lock`.
+        """
+        # Remove the oldest unit of the product from the marketplace
+        producers = self.products[product]
+        producer_id = producers.popleft()
+        if not producers:
+            del self.products[product]
+
+        # Decrease the number of products for the producer
+        self.producer_num_products[producer_id] -= 1
+        if self.quota is not None:
+            self.quota.released(producer_id, product)
+        self._changed(product, producer_id)
+        self._served(cart_id, product)
+
+        # Add the product to the cart
+        self.carts[cart_id].add_product(product, producer_id)
+
+        self.progress += 1
+        self.stats['reserved'] += 1
+        if self.event_log is not None:
+            self.event_log.record('add', product, producer_id, cart_id)
+        self.feed.emit('reserved', product, producer_id, cart_id)
+        if self.admission is not None:
+            self.admission.succeeded(cart_id)
+
+        # Log the results
+        self.logger.log(f'[W] Added {product} to cart {cart_id}')
+
+    def discard(self, producer_id, product):
+        """
+        Discards an available unit of a product published by the given producer,
+        freeing a slot of its queue. Used to recover from stalls.
+
+        :returns True or False, if the producer has no available unit of the product
+        """
+        with self.add_to_cart_lock:
+            producers = self.products.get(product)
+            if not producers or producer_id not in producers:
+                return False
+
+            producers.remove(producer_id)
+            if not producers:
+                del self.products[product]
+            self.producer_num_products[producer_id] -= 1
+            if self.quota is not None:
+                self.quota.released(producer_id, product)
+            self._changed(product, producer_id)
+            self.progress += 1
 
-            # Log the results
-            self.logger.log(f'[W] Added {product} to cart {cart_id}')
+        self.logger.log(f'[W] Discarded {product} of producer {producer_id}')
 
         return True
 
+    def stock_by_producer(self):
+        """
+        Returns a consistent view of the available units of every producer.
+
+        :rtype: Dict
+        :return: {producer_id: {product: number of units}}
+        """
+        stock = {}
+        with self.add_to_cart_lock:
+            for product, producer_ids in self.products.items():
+                for producer_id in producer_ids:
+                    units = stock.setdefault(producer_id, {})
+                    units[product] = units.get(product, 0) + 1
+
+        return stock
+
+    @traced('marketplace')
     def remove_from_cart(self, cart_id, product):
         """
         Removes a product from cart.
@@ -175,31 +565,59 @@ class Marketplace:
             self.logger.log(f'[X] Cart {cart_id} not created yet')
             return False
 
-        # Check if the product is in the cart
-        if product not in self.carts[cart_id].get_products():
+        if self.combiner is not None:
+            removed = self.combiner.submit(product, self._return, cart_id, product)
+        else:
+            with self.add_to_cart_lock:
+                removed = self._return(cart_id, product)
+
+        # Log the results
+        if removed:
+            self.logger.log(f'[W] Removed {product} from cart {cart_id}')
+
+        return removed
+
+    def _return(self, cart_id, product):
+        """
+        Gives a product of the given cart back to the marketplace.
+        The caller must hold `add_to_cart_lock`.
+        """
+        # Remove from `cart_id`, if the product is in the cart
+        producer_id = self.carts[cart_id].remove_product(product)
+        if producer_id == -1:
             self.logger.log(f'[X] Product {product} not in cart {cart_id}')
             return False
 
-        # Remove from `cart_id`
-        self.carts[cart_id].remove_product(product)
-
         # Make the product available again in the marketplace
-        self.products.append(product)
+        self.products.setdefault(product, deque()).append(producer_id)
 
         # Increase the number of products for the producer
-        self.producer_num_products[self.product_to_producer[product]] += 1
+        self.producer_num_products[producer_id] += 1
+        if self.quota is not None:
+            self.quota.taken(producer_id, product)
+        self._changed(product, producer_id)
 
-        # Log the results
-        self.logger.log(f'[W] Removed {product} from cart {cart_id}')
+        self.progress += 1
+        if self.event_log is not None:
+            self.event_log.record('remove', product, producer_id, cart_id)
+        self.feed.emit('returned', product, producer_id, cart_id)
 
         return True
 
-    def place_order(self, cart_id):
+    @traced('marketplace')
+    def place_order(self, cart_id, summary=False, receipt=False):
         """
         Return a list with all the products in the cart.
 
         :type cart_id: Int
         :param cart_id: id cart
+
+        :type summary: Boolean
+        :param summary: return the OrderSummary of the cart instead of the list,
+        which doesn't depend on the size of the cart
+
+        :type receipt: Boolean
+        :param receipt: return the {product: count} receipt of the cart instead of the list
         """
         # Log the input parameters
         self.logger.log(f'[?] Placing order for cart {cart_id}')
@@ -209,11 +627,32 @@ class Marketplace:
             self.logger.log(f'[X] Cart {cart_id} not created yet')
             return False
 
-        # Get the products from the cart
-        products = self.carts[cart_id].get_products()
+        cart = self.carts[cart_id]
+        with self.add_to_cart_lock:
+            self.progress += 1
+            # The cart doesn't wait for anything anymore, even if its consumer gave up
+            for product in [product for product, carts in self.waiting.items()
+                            if cart_id in carts]:
+                self._served(cart_id, product)
+            self.stats['orders'] += 1
+            self.stats['order_time'] += monotonic() - cart.created
+
+        if self.event_log is not None:
+            for item in cart.products:
+                self.event_log.record('order', item['product'], item['producer_id'], cart_id)
+        if self.feed.num_subscribers:
+            self.feed.emit('order_placed', tuple(cart.get_products()), cart_id=cart_id)
+        if self.admission is not None:
+            self.admission.forget(cart_id)
 
         # Log the results
         self.logger.log(f'[W] Placed order for cart {cart_id}')
 
-        return products
+        if summary:
+            return cart.summary()
+        if receipt:
+            return cart.receipt()
+
+        # Get the products from the cart
+        return cart.get_products()
         
\ No newline at end of file
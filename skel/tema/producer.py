@@ -2,15 +2,22 @@
 This module represents the Producer.
 """
 
-from threading import Thread
-from time import sleep
+from threading import Thread, Event
+try:
+    from .tracer import TRACER
+except ImportError:
+    from tracer import TRACER
+try:
+    from .profiler import PROFILER
+except ImportError:
+    from profiler import PROFILER
 
 class Producer(Thread):
     """
     Class that represents a producer.
     """
 
-    def __init__(self, products, marketplace, republish_wait_time, **kwargs):
+    def __init__(self, products, marketplace, republish_wait_time, demand_driven=False, **kwargs):
         """
         Constructor.
 
@@ -24,6 +31,10 @@ class Producer(Thread):
         :param republish_wait_time: the number of seconds that a producer must
         wait until the marketplace becomes available
 
+        :type demand_driven: Boolean
+        :param demand_driven: publish first the products the consumers wait for,
+        following the list of products only when there is no unmet demand
+
         :type kwargs:
         :param kwargs: other arguments that are passed to the Thread's __init__()
         """
@@ -31,14 +42,83 @@ class Producer(Thread):
         self.products = products # List of products to produce
         self.marketplace = marketplace # Marketplace reference
         self.republish_wait_time = republish_wait_time # Time to wait before republishing
+        self.demand_driven = demand_driven # Pick the next product by the unmet demand
         self.producer_id = marketplace.register_producer() # Producer ID
+        self.stopped = Event() # Set when the producer must stop
 
-    def run(self):
+    def produce(self):
+        """
+        Produces the products forever. Yields the number of seconds to wait before
+        the next step, so that the caller decides how to wait (sleep on the thread
+        or schedule the next step on a timer).
+        """
+        if self.demand_driven:
+            return self.produce_on_demand()
+
+        return self.produce_in_order()
+
+    def produce_in_order(self):
+        """
+        Produces the products in the order of the list, forever.
+        """
         while True:
+            over_quota = 0 # Products skipped in this cycle because of their quota
             for product, quantity, wait_time in self.products:
                 # Wait `wait_time` seconds before producing the next product
-                sleep(wait_time)
+                yield wait_time
 
                 # Wait until the marketplace signals that the `Producer` can publish
-                _ = [sleep(self.republish_wait_time) for _ in range(quantity) \
-                        if not self.marketplace.publish(self.producer_id, product)]
+                for _ in range(quantity):
+                    published = self.marketplace.publish(self.producer_id, product)
+                    # The product reached its quota: move on to the next product,
+                    # the rest of the units are published in the next cycle
+                    if getattr(published, 'over_quota', False):
+                        over_quota += 1
+                        break
+                    if not published:
+                        yield self.republish_wait_time
+
+            # Don't spin if every product reached its quota
+            if over_quota == len(self.products):
+                yield self.republish_wait_time
+
+    def produce_on_demand(self):
+        """
+        Produces the product with the highest unmet demand, one unit at a time.
+        When no product is in demand, takes a step of the list of products.
+        """
+        catalog = [product for product, _, _ in self.products]
+        steps = {product: (quantity, wait_time) for product, quantity, wait_time in self.products}
+        schedule = self.produce_in_order()
+
+        while True:
+            product = self.marketplace.next_demanded(self.producer_id, catalog)
+            if product is None:
+                yield next(schedule)
+                continue
+
+            # Publish up to `quantity` units, while the demand isn't met
+            quantity, wait_time = steps[product]
+            yield wait_time
+            for _ in range(quantity):
+                if not self.marketplace.publish(self.producer_id, product):
+                    yield self.republish_wait_time
+                    break
+                if self.marketplace.demand(product) <= self.marketplace.available(product):
+                    break
+
+    def stop(self):
+        """
+        Stops the producer and waits for it to finish.
+        """
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        with PROFILER.profile('producer'):
+            for wait_time in self.produce():
+                with TRACER.span('sleep', 'producer'):
+                    # Sleep, waking up early on `stop()`
+                    if self.stopped.wait(wait_time):
+                        return
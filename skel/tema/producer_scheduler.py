@@ -0,0 +1,65 @@
+"""
+This module represents the ProducerScheduler.
+"""
+
+import heapq
+from itertools import count
+from threading import Thread, Event
+from time import monotonic
+try:
+    from .profiler import PROFILER
+except ImportError:
+    from profiler import PROFILER
+
+class ProducerScheduler(Thread):
+    """
+    Class that drives the schedules of all the producers from a single timer thread.
+    Every producer step is kept in a heap ordered by the instant it is due at.
+    """
+
+    def __init__(self, producers, **kwargs):
+        """
+        Constructor.
+
+        :type producers: List
+        :param producers: the producers to drive (anything that has a `produce()` generator)
+
+        :type kwargs:
+        :param kwargs: other arguments that are passed to the Thread's __init__()
+        """
+        Thread.__init__(self, **kwargs)
+        self.seq = count() # Tie breaker, so that the generators are never compared
+        self.stopped = Event() # Set once there is no more demand
+
+        now = monotonic()
+        self.steps = [(now, next(self.seq), producer.produce()) for producer in producers]
+        heapq.heapify(self.steps)
+
+    def stop(self):
+        """
+        Stops the scheduler and waits for it to finish.
+        """
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        with PROFILER.profile('producer'):
+            self._run_steps()
+
+    def _run_steps(self):
+        while self.steps and not self.stopped.is_set():
+            due, _, step = self.steps[0]
+
+            # Sleep until the next step is due, waking up early on `stop()`
+            delay = due - monotonic()
+            if delay > 0 and self.stopped.wait(delay):
+                break
+
+            # Run the step and schedule the next one
+            try:
+                wait_time = next(step)
+            except StopIteration:
+                heapq.heappop(self.steps)
+                continue
+            heapq.heapreplace(self.steps, (monotonic() + wait_time, next(self.seq), step))
@@ -0,0 +1,105 @@
+"""
+This module represents the Profiler.
+"""
+
+import cProfile
+import pstats
+import sys
+from contextlib import contextmanager, nullcontext
+from threading import Lock
+
+class Profiler:
+    """
+    Class that profiles every producer and consumer thread and merges their stats.
+    `cProfile` only profiles the thread it's enabled on, so every thread enables
+    its own profiler and hands it over once it finishes.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.enabled = False
+        self.profiles = {} # {role: [cProfile.Profile, ...]}
+        self.profiles_lock = Lock() # Lock for `profiles`
+
+    def enable(self):
+        """
+        Enables profiling for the threads that start afterwards.
+        """
+        self.enabled = True
+
+    def profile(self, role):
+        """
+        Returns a context manager that profiles the `with` block, in the calling thread.
+
+        :type role: String
+        :param role: the role of the thread (producer, consumer)
+        """
+        if not self.enabled:
+            return nullcontext()
+
+        return self._profile(role)
+
+    @contextmanager
+    def _profile(self, role):
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield profile
+        finally:
+            profile.disable()
+            with self.profiles_lock:
+                self.profiles.setdefault(role, []).append(profile)
+
+    def stats(self):
+        """
+        Merges the stats of all the threads. Every function is tagged with
+        the role of the threads it ran on, e.g. `add_to_cart [consumer]`.
+
+        :rtype: pstats.Stats
+        :return: the merged stats
+        """
+        merged = pstats.Stats()
+        with self.profiles_lock:
+            profiles = {role: list(profiles) for role, profiles in self.profiles.items()}
+
+        for role, role_profiles in profiles.items():
+            def tag(func, role=role):
+                filename, line, name = func
+                return filename, line, f'{name} [{role}]'
+
+            role_stats = pstats.Stats(*role_profiles)
+            tagged = pstats.Stats()
+            tagged.stats = {tag(func): (cc, nc, tt, ct,
+                                        {tag(caller): timing for caller, timing in callers.items()})
+                            for func, (cc, nc, tt, ct, callers) in role_stats.stats.items()}
+            tagged.get_top_level_stats()
+            merged.add(tagged)
+
+        return merged
+
+    def report(self, filename, top=20, stream=sys.stderr):
+        """
+        Writes the merged stats to a pstats file and prints the hottest functions
+        by self time, for every role.
+
+        :type filename: String
+        :param filename: the pstats file
+
+        :type top: Int
+        :param top: the number of functions printed for every role
+        """
+        stats = self.stats()
+        stats.dump_stats(filename)
+
+        stats.stream = stream
+        stats.sort_stats(pstats.SortKey.TIME)
+        with self.profiles_lock:
+            roles = {role: len(profiles) for role, profiles in self.profiles.items()}
+        for role, num_threads in sorted(roles.items()):
+            print(f'{role}: {num_threads} threads', file=stream)
+            stats.print_stats(rf'\[{role}\]', top)
+
+
+PROFILER = Profiler()
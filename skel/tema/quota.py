@@ -0,0 +1,66 @@
+"""
+This module represents the ProductQuota.
+"""
+
+class QuotaExceeded:
+    """
+    Falsy result of a `publish()` that was rejected because the product reached its quota
+    in the producer's queue, while the queue itself still has free slots.
+    """
+
+    over_quota = True
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return 'QuotaExceeded()'
+
+
+class ProductQuota:
+    """
+    Class that caps the number of slots a single product can take in a producer's queue,
+    so that a fast-cycling product can't starve the producer's other products.
+    The units of every (producer, product) pair are counted as they are published,
+    reserved, returned and discarded, so every check is O(1).
+    It's used under the Marketplace's stock lock, so it has no lock of its own.
+    """
+
+    def __init__(self, quota, queue_size_per_producer):
+        """
+        Constructor
+
+        :type quota: Int or Float
+        :param quota: the maximum number of slots of a product, or the share of the queue
+            it can take if it's less than 1
+
+        :type queue_size_per_producer: Int
+        :param queue_size_per_producer: the maximum size of a queue associated with each producer
+        """
+        if quota < 1:
+            quota = max(1, int(quota * queue_size_per_producer))
+        self.quota = int(quota)
+        self.units = {} # {(producer_id, product): units available in the marketplace}
+
+    def allows(self, producer_id, product):
+        """
+        Returns True if the producer can publish another unit of the product.
+        """
+        return self.units.get((producer_id, product), 0) < self.quota
+
+    def taken(self, producer_id, product):
+        """
+        Records that a unit of the product takes a slot of the producer's queue.
+        """
+        key = (producer_id, product)
+        self.units[key] = self.units.get(key, 0) + 1
+
+    def released(self, producer_id, product):
+        """
+        Records that a unit of the product left the producer's queue.
+        """
+        key = (producer_id, product)
+        if self.units[key] == 1:
+            del self.units[key]
+        else:
+            self.units[key] -= 1
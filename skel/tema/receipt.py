@@ -0,0 +1,97 @@
+"""
+This module represents the receipts: the compact, count-based output format.
+
+A receipt line is `consumer product_id count`: the number of units of a product
+a consumer bought, over all its carts. The legacy format repeats a
+`consumer bought Product(...)` line for every unit; `expand()` turns receipts back into it.
+"""
+
+from collections import Counter
+from json import loads
+try:
+    from .product import Coffee, Tea
+except ImportError:
+    from product import Coffee, Tea
+
+PRODUCT_TYPES = {'Coffee': Coffee, 'Tea': Tea}
+
+
+def format_receipt(consumer, product_id, count):
+    """
+    Returns the receipt line of `count` units of a product bought by a consumer.
+    """
+    return f'{consumer} {product_id} {count}'
+
+
+def format_receipts(receipts):
+    """
+    Returns the sorted receipt lines of {(consumer, product_id): count}.
+    """
+    return [format_receipt(consumer, product_id, count)
+            for (consumer, product_id), count in sorted(receipts.items()) if count > 0]
+
+
+def is_receipt(text):
+    """
+    Returns True if the text is in the receipt format rather than the legacy one.
+    """
+    for line in text.splitlines():
+        if line.strip():
+            return ' bought ' not in line
+
+    return True
+
+
+def parse_receipts(text):
+    """
+    Parses receipt lines, summing the counts of the lines of the same consumer and product.
+
+    :rtype: Counter
+    :return: {(consumer, product_id): count}
+    """
+    receipts = Counter()
+    for line in text.splitlines():
+        if line.strip():
+            consumer, product_id, count = line.split()
+            receipts[consumer, product_id] += int(count)
+
+    return receipts
+
+
+def load_products(filename):
+    """
+    Builds the products of a `.in` or `.json` scenario.
+
+    :rtype: Dict
+    :return: {product_id: product}
+    """
+    with open(filename, encoding='utf-8') as input_file:
+        market_config = loads(input_file.read())
+
+    products = {}
+    for product_id, product in market_config['products'].items():
+        params = {k: v for k, v in product.items() if k != 'product_type'}
+        products[product_id] = PRODUCT_TYPES[product['product_type']](**params)
+
+    return products
+
+
+def expand(receipts, products):
+    """
+    Expands receipts to the legacy format, one line per unit.
+
+    :type receipts: Dict
+    :param receipts: {(consumer, product_id): count}
+
+    :type products: Dict
+    :param products: {product_id: product}
+
+    :rtype: List
+    :return: the sorted `consumer bought Product(...)` lines
+    """
+    lines = []
+    for (consumer, product_id), count in receipts.items():
+        lines += [f'{consumer} bought {products[product_id]}'] * count
+    lines.sort()
+
+    return lines
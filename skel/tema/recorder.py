@@ -0,0 +1,244 @@
+"""
+This module represents the RecordingMarketplace, which records every call
+to a Marketplace into a compact, append-only trace file, and the trace reader.
+
+Trace layout (little endian):
+    - header: magic, version, queue_size_per_producer
+    - then records, in the order the calls returned:
+        - product: the JSON description of a product, the first time it's seen,
+          in the same shape as in the `.in` files; products are referred to by index
+        - call: method, stream, start time, latency, id argument (producer or cart),
+          encoded result and the indexes of its product arguments
+
+A stream is the sequence of calls of one logical caller, which are made one at
+a time, whichever thread makes them: a producer, or the consumer that the thread
+runs (see `set_caller()`). With a pool of workers, a consumer moves between
+threads, so the threads don't keep the order of its calls.
+"""
+
+import struct
+from dataclasses import asdict
+from json import dumps, loads
+from threading import Lock, get_ident, local
+from time import perf_counter
+try:
+    from .product import Coffee, Tea
+except ImportError:
+    from product import Coffee, Tea
+
+MAGIC = b'MPTR'
+VERSION = 2
+
+HEADER = struct.Struct('<4sHHI') # (magic, version, reserved, queue_size_per_producer)
+KIND = struct.Struct('<B') # Record kind, followed by the record
+PRODUCT = struct.Struct('<I') # JSON length, followed by the JSON
+CALL = struct.Struct('<BIddiiH') # (method, stream, start, latency, id, result, num products)
+PRODUCT_INDEX = struct.Struct('<I')
+
+KIND_PRODUCT = 0
+KIND_CALL = 1
+METHODS = ('register_producer', 'publish', 'new_cart', 'add_to_cart',
+           'add_any_to_cart', 'remove_from_cart', 'place_order')
+PRODUCER_METHODS = ('register_producer', 'publish')
+
+CALLER = local() # `CALLER.name`: the logical caller of the current thread, if any
+
+
+def set_caller(name):
+    """
+    Sets the logical caller (the consumer) of the marketplace calls made by the current
+    thread, until the next call. A worker that resumes another consumer sets it again.
+    """
+    CALLER.name = name
+
+
+class RecordingMarketplace:
+    """
+    Class that wraps a Marketplace and records every call of its public API,
+    with its stream (producer or consumer), timestamps, arguments and result.
+    Everything else is delegated to the wrapped marketplace.
+    """
+
+    def __init__(self, marketplace, filename):
+        """
+        Constructor
+
+        :type marketplace: Marketplace
+        :param marketplace: the recorded marketplace
+
+        :type filename: String
+        :param filename: the path of the trace file
+        """
+        self.marketplace = marketplace
+        self.trace = open(filename, 'wb') # pylint: disable=consider-using-with
+        self.trace.write(HEADER.pack(MAGIC, VERSION, 0, marketplace.queue_size_per_producer))
+
+        self.product_index = {} # {product: index in the trace}
+        self.streams = {} # {logical caller: stream index in the trace}
+        self.start = perf_counter()
+        self.lock = Lock() # Lock for the trace file and the tables
+
+    def __getattr__(self, name):
+        return getattr(self.marketplace, name)
+
+    def _record(self, method, start, end, id_, result, products=()):
+        """
+        Appends a call to the trace. A producer's calls are in the stream of its id
+        (`register_producer()` has no id argument and starts the stream of the id it
+        returns); the cart calls are in the stream of the thread's logical caller,
+        or of the thread itself if it has none.
+        """
+        if method in PRODUCER_METHODS:
+            owner = ('producer', result if id_ == -1 else id_)
+        elif getattr(CALLER, 'name', None) is not None:
+            owner = ('consumer', CALLER.name)
+        else:
+            owner = ('thread', get_ident())
+        with self.lock:
+            stream = self.streams.setdefault(owner, len(self.streams))
+            indexes = []
+            for product in products:
+                if product not in self.product_index:
+                    self.product_index[product] = len(self.product_index)
+                    data = dumps({'product_type': type(product).__name__,
+                                  **asdict(product)}).encode('utf-8')
+                    self.trace.write(KIND.pack(KIND_PRODUCT) + PRODUCT.pack(len(data)) + data)
+                indexes.append(self.product_index[product])
+
+            self.trace.write(KIND.pack(KIND_CALL)
+                             + CALL.pack(METHODS.index(method), stream, start - self.start,
+                                         end - start, id_, result, len(indexes))
+                             + b''.join(PRODUCT_INDEX.pack(index) for index in indexes))
+
+    def register_producer(self):
+        """
+        Records `register_producer()`.
+        """
+        start = perf_counter()
+        producer_id = self.marketplace.register_producer()
+        self._record('register_producer', start, perf_counter(), -1, int(producer_id))
+
+        return producer_id
+
+    def publish(self, producer_id, product):
+        """
+        Records `publish()`.
+        """
+        start = perf_counter()
+        published = self.marketplace.publish(producer_id, product)
+        self._record('publish', start, perf_counter(), int(producer_id), bool(published),
+                     [product])
+
+        return published
+
+    def new_cart(self):
+        """
+        Records `new_cart()`.
+        """
+        start = perf_counter()
+        cart_id = self.marketplace.new_cart()
+        self._record('new_cart', start, perf_counter(), -1, cart_id)
+
+        return cart_id
+
+    def add_to_cart(self, cart_id, product):
+        """
+        Records `add_to_cart()`.
+        """
+        start = perf_counter()
+        added = self.marketplace.add_to_cart(cart_id, product)
+        self._record('add_to_cart', start, perf_counter(), cart_id, bool(added), [product])
+
+        return added
+
+    def add_any_to_cart(self, cart_id, products):
+        """
+        Records `add_any_to_cart()`. The result is the index of the alternative
+        that was added, or -1.
+        """
+        start = perf_counter()
+        added = self.marketplace.add_any_to_cart(cart_id, products)
+        self._record('add_any_to_cart', start, perf_counter(), cart_id,
+                     list(products).index(added) if added else -1, list(products))
+
+        return added
+
+    def remove_from_cart(self, cart_id, product):
+        """
+        Records `remove_from_cart()`.
+        """
+        start = perf_counter()
+        removed = self.marketplace.remove_from_cart(cart_id, product)
+        self._record('remove_from_cart', start, perf_counter(), cart_id, bool(removed),
+                     [product])
+
+        return removed
+
+    def place_order(self, cart_id, summary=False, receipt=False):
+        """
+        Records `place_order()`. The result is the number of ordered products.
+        """
+        start = perf_counter()
+        products = self.marketplace.place_order(cart_id, summary, receipt)
+        if summary:
+            num_products = products.num_items if products else 0
+        elif receipt:
+            num_products = sum(products.values()) if products else 0
+        else:
+            num_products = len(products) if products else 0
+        self._record('place_order', start, perf_counter(), cart_id, num_products)
+
+        return products
+
+    def close(self):
+        """
+        Flushes and closes the trace file.
+        """
+        with self.lock:
+            self.trace.close()
+
+
+def _decode_product(description):
+    description = loads(description)
+    if description.pop('product_type') == 'Coffee':
+        return Coffee(**description)
+
+    return Tea(**description)
+
+
+def read_trace(filename):
+    """
+    Reads a trace file.
+
+    :rtype: Tuple
+    :return: (queue_size_per_producer, list of calls); every call is a tuple
+        (method, stream, start, latency, id, result, products)
+    """
+    with open(filename, 'rb') as trace:
+        data = trace.read()
+
+    magic, version, _, queue_size_per_producer = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'{filename} is not a version {VERSION} trace')
+
+    products = []
+    calls = []
+    offset = HEADER.size
+    while offset < len(data):
+        kind, = KIND.unpack_from(data, offset)
+        offset += KIND.size
+        if kind == KIND_PRODUCT:
+            length, = PRODUCT.unpack_from(data, offset)
+            offset += PRODUCT.size
+            products.append(_decode_product(data[offset:offset + length]))
+            offset += length
+        else:
+            method, stream, start, latency, id_, result, num_products = \
+                CALL.unpack_from(data, offset)
+            offset += CALL.size
+            call_products = [products[PRODUCT_INDEX.unpack_from(data, offset + i * 4)[0]]
+                             for i in range(num_products)]
+            offset += num_products * PRODUCT_INDEX.size
+            calls.append((METHODS[method], stream, start, latency, id_, result, call_products))
+
+    return queue_size_per_producer, calls
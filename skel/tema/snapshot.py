@@ -0,0 +1,75 @@
+"""
+This module represents the InventorySnapshot.
+"""
+
+from types import MappingProxyType
+
+class InventorySnapshot:
+    """
+    Class that represents an immutable, versioned view of the Marketplace's stock.
+    The writers never modify a snapshot: under the stock lock, they copy the previous one
+    with the changes since then applied and publish the copy with a single reference
+    assignment. So the readers never wait for a lock and always see a consistent
+    version of the stock.
+    """
+
+    __slots__ = ('version', 'units', 'loads', 'queue_size_per_producer')
+
+    def __init__(self, version, units, loads, queue_size_per_producer):
+        """
+        Constructor
+
+        :type version: Int
+        :param version: the number of stock changes the snapshot includes
+
+        :type units: Dict
+        :param units: {product: available units}, only for the products in stock
+
+        :type loads: Dict
+        :param loads: {producer_id: number of products}
+
+        :type queue_size_per_producer: Int
+        :param queue_size_per_producer: the maximum size of a queue associated with each producer
+        """
+        self.version = version
+        self.units = MappingProxyType(units)
+        self.loads = MappingProxyType(loads)
+        self.queue_size_per_producer = queue_size_per_producer
+
+    def updated(self, version, units, loads, queue_size_per_producer):
+        """
+        Returns a later version of the snapshot, with the new numbers of units of the
+        changed products (0 if they are out of stock), the new loads of the changed
+        producers and the current queue size.
+        """
+        new_units = dict(self.units)
+        for product, count in units.items():
+            if count:
+                new_units[product] = count
+            else:
+                new_units.pop(product, None)
+
+        return InventorySnapshot(version, new_units, {**self.loads, **loads},
+                                 queue_size_per_producer)
+
+    def available(self, product):
+        """
+        Returns the number of available units of a product.
+        """
+        return self.units.get(product, 0)
+
+    def producer_load(self, producer_id):
+        """
+        Returns the number of products of a producer in the marketplace.
+        """
+        return self.loads.get(producer_id, 0)
+
+    def free_slots(self, producer_id):
+        """
+        Returns the number of products a producer can still publish.
+        """
+        return max(self.queue_size_per_producer - self.producer_load(producer_id), 0)
+
+    def __repr__(self):
+        return (f'InventorySnapshot(version={self.version}, products={len(self.units)}, '
+                f'units={sum(self.units.values())})')
@@ -2,10 +2,32 @@
 This module represents the Unittesting component of the Marketplace module.
 """
 
+import os
+import contextlib
+import tempfile
 import unittest
+import io
+import json
 import random
+from collections import deque
+from collections.abc import Sequence
+from types import SimpleNamespace
+from threading import Event, Thread
+from time import monotonic
 from marketplace import Marketplace
 from product import Coffee, Tea
+from change_feed import ChangeFeed
+from admission import AdmissionController
+from quota import ProductQuota
+from recorder import RecordingMarketplace, read_trace, set_caller
+from autotuner import AutoTuner
+from federation import MarketplaceFederation
+from consumer_pool import ConsumerPool
+from watchdog import Watchdog
+from tracer import Tracer, TracedLock
+from producer_scheduler import ProducerScheduler
+from profiler import Profiler
+from receipt import format_receipts, parse_receipts, is_receipt, expand
 
 NUM_PRODUCERS = 10
 NUM_CARTS = 10
@@ -70,13 +92,16 @@ class MarketplaceTestCase(unittest.TestCase):
 
     def test_new_cart(self):
         """
-        Tests the `new_cart()` method.
+        Tests the `new_cart()` and `cart()` methods.
         """
         # Create a list of carts
         carts = [self.marketplace.new_cart() for _ in range(NUM_CARTS)]
 
         # Check if the carts were created
         _ = [self.assertIn(cart, self.marketplace.carts) for cart in carts]
+        _ = [self.assertIs(self.marketplace.cart(cart), self.marketplace.carts[cart])
+             for cart in carts]
+        self.assertIsNone(self.marketplace.cart(NUM_CARTS + 1))
 
     def test_add_to_cart(self):
         """
@@ -152,3 +177,542 @@ class MarketplaceTestCase(unittest.TestCase):
 
         # Check if the order was placed
         self.assertEqual(order_products_before, order_products_after)
+
+    def test_product_provenance(self):
+        """
+        Tests that equal products published by different producers keep their producer.
+        """
+        prod1 = Coffee(name='Indonezia', price=1, acidity=5.05, roast_level='MEDIUM')
+
+        # The first producer already published `prod1`, the second one publishes it too
+        self.assertTrue(self.marketplace.publish(1, prod1))
+
+        # The oldest unit is the first one to be added to a cart
+        cart_id = self.marketplace.new_cart()
+        self.assertTrue(self.marketplace.add_to_cart(cart_id, prod1))
+        self.assertEqual(self.marketplace.producer_num_products[0], 4)
+        self.assertEqual(self.marketplace.producer_num_products[1], 1)
+
+        # Removing the unit gives it back to its own producer
+        self.assertTrue(self.marketplace.remove_from_cart(cart_id, prod1))
+        self.assertEqual(self.marketplace.producer_num_products[0], 5)
+        self.assertEqual(self.marketplace.producer_num_products[1], 1)
+
+    def test_subscribe(self):
+        """
+        Tests the `subscribe()` method.
+        """
+        subscription = self.marketplace.subscribe()
+        prod1 = Coffee(name='Indonezia', price=1, acidity=5.05, roast_level='MEDIUM')
+
+        # Reserve, return and order a product
+        cart_id = self.marketplace.new_cart()
+        self.marketplace.add_to_cart(cart_id, prod1)
+        self.marketplace.remove_from_cart(cart_id, prod1)
+        self.marketplace.add_to_cart(cart_id, prod1)
+        self.marketplace.place_order(cart_id)
+
+        events = subscription.poll()
+        self.assertEqual([event.kind for event in events],
+                         ['reserved', 'returned', 'reserved', 'order_placed'])
+        self.assertEqual(events[-1].product, (prod1,))
+        self.assertEqual(subscription.poll(), [])
+
+        # A subscriber that doesn't keep up drops the overwritten events
+        self.marketplace.feed = ChangeFeed(capacity=8)
+        subscription = self.marketplace.subscribe()
+        for _ in range(10):
+            self.marketplace.publish(1, prod1)
+            self.marketplace.add_to_cart(cart_id, prod1)
+        self.assertEqual(len(list(subscription)), 8)
+        self.assertEqual(subscription.dropped, 12)
+
+    def test_admission(self):
+        """
+        Tests that the admission control sheds the retries on products out of stock.
+        """
+        self.marketplace.admission = AdmissionController(caller_rate=1, caller_burst=2,
+                                                         max_waiting=1)
+        prod1 = Coffee(name='Indonezia', price=1, acidity=5.05, roast_level='MEDIUM')
+        prod2 = Coffee(name='Indonezia2', price=1, acidity=5.05, roast_level='MEDIUM')
+        cart_id = self.marketplace.new_cart()
+
+        # The caller's bucket allows 2 retries, then the attempts are rejected with a hint
+        self.assertFalse(self.marketplace.add_to_cart(cart_id, prod2))
+        self.assertFalse(self.marketplace.add_to_cart(cart_id, prod2))
+        rejection = self.marketplace.add_to_cart(cart_id, prod2)
+        self.assertFalse(rejection)
+        self.assertGreater(rejection.retry_after, 0)
+
+        # Only one cart can wait at a time
+        other_cart_id = self.marketplace.new_cart()
+        self.assertEqual(self.marketplace.add_to_cart(other_cart_id, prod2).retry_after,
+                         self.marketplace.admission.waiting_retry_after)
+
+        # The products in stock are never rejected
+        self.assertTrue(self.marketplace.add_to_cart(other_cart_id, prod1))
+
+    def test_add_any_to_cart(self):
+        """
+        Tests the `add_any_to_cart()` method.
+        """
+        prod1 = Coffee(name='Indonezia', price=1, acidity=5.05, roast_level='MEDIUM')
+        prod2 = Coffee(name='Indonezia2', price=1, acidity=5.05, roast_level='MEDIUM')
+        cart_id = self.marketplace.new_cart()
+
+        # The first available alternative is reserved, in the order of preference
+        self.assertEqual(self.marketplace.add_any_to_cart(cart_id, [prod2, prod1]), prod1)
+        self.assertEqual(self.marketplace.place_order(cart_id), [prod1])
+
+        # None of the alternatives is available
+        self.assertFalse(self.marketplace.add_any_to_cart(cart_id, [prod2, prod1]))
+
+    def test_watchdog_wanted(self):
+        """
+        Tests that the watchdog counts every alternative of an 'add_any' operation,
+        whatever Sequence holds them.
+        """
+        prod1 = Coffee(name='Indonezia', price=1, acidity=5.05, roast_level='MEDIUM')
+        prod2 = Tea(name='Wild Cherry', price=5, type='Black')
+
+        class Alternatives(Sequence): # Like the tables of the binary scenarios
+            """
+            Read-only sequence of alternatives.
+            """
+            def __getitem__(self, index):
+                return (prod1, prod2)[index]
+
+            def __len__(self):
+                return 2
+
+        waiting = {'cons1': prod1, 'cons2': Alternatives(), 'cons3': [prod2]}
+        self.assertEqual(Watchdog.wanted(waiting), {prod1: 2, prod2: 2})
+
+        # Only the products out of stock are blocking
+        prod6 = Tea(name='Jasmine', price=3, type='Green')
+        stream = io.StringIO()
+        Watchdog(self.marketplace, [], stream=stream).diagnose({'cons1': prod1, 'cons2': prod6})
+        diagnosis = stream.getvalue()
+        blocking = diagnosis[diagnosis.index('blocking products'):]
+        self.assertIn(f'{prod6}: 1 consumers', blocking)
+        self.assertNotIn(str(prod1), blocking)
+
+    def test_discard(self):
+        """
+        Tests the `discard()` and `stock_by_producer()` methods.
+        """
+        prod1 = Coffee(name='Indonezia', price=1, acidity=5.05, roast_level='MEDIUM')
+        prod2 = Coffee(name='Indonezia2', price=1, acidity=5.05, roast_level='MEDIUM')
+        self.assertEqual(len(self.marketplace.stock_by_producer()[0]), 5)
+
+        progress = self.marketplace.progress
+        self.assertTrue(self.marketplace.discard(0, prod1))
+        self.assertGreater(self.marketplace.progress, progress)
+        self.assertNotIn(prod1, self.marketplace.stock_by_producer()[0])
+        self.assertEqual(self.marketplace.producer_num_products[0], 4)
+
+        # Nothing left to discard
+        self.assertFalse(self.marketplace.discard(0, prod1))
+        self.assertFalse(self.marketplace.discard(0, prod2))
+
+    def test_quota(self):
+        """
+        Tests that a product can't take more than its quota of a producer's queue.
+        """
+        self.marketplace.quota = ProductQuota(2, self.marketplace.queue_size_per_producer)
+        prod1 = Tea(name='Jasmine', price=3, type='Green')
+        prod2 = Tea(name='Linden', price=9, type='Herbal')
+        id_ = self.marketplace.register_producer()
+
+        self.assertTrue(self.marketplace.publish(id_, prod1))
+        self.assertTrue(self.marketplace.publish(id_, prod1))
+        rejection = self.marketplace.publish(id_, prod1)
+        self.assertFalse(rejection)
+        self.assertTrue(rejection.over_quota)
+
+        # The other products of the producer still have free slots
+        self.assertTrue(self.marketplace.publish(id_, prod2))
+
+        # Reserving a unit frees a slot of the product's quota
+        cart_id = self.marketplace.new_cart()
+        self.assertTrue(self.marketplace.add_to_cart(cart_id, prod1))
+        self.assertTrue(self.marketplace.publish(id_, prod1))
+
+    def test_snapshot(self):
+        """
+        Tests the `snapshot()`, `available()` and `producer_load()` methods.
+        """
+        prod1 = Coffee(name='Indonezia', price=1, acidity=5.05, roast_level='MEDIUM')
+        snapshot = self.marketplace.snapshot()
+        self.assertEqual(self.marketplace.available(prod1), 1)
+        self.assertEqual(self.marketplace.producer_load(0), 5)
+        self.assertEqual(snapshot.free_slots(0), 3)
+
+        # The writers publish a new version instead of changing the old one
+        cart_id = self.marketplace.new_cart()
+        self.marketplace.add_to_cart(cart_id, prod1)
+        self.assertEqual(self.marketplace.available(prod1), 0)
+        self.assertEqual(self.marketplace.producer_load(0), 4)
+        self.assertGreater(self.marketplace.snapshot().version, snapshot.version)
+        self.assertEqual(snapshot.available(prod1), 1)
+        with self.assertRaises(TypeError):
+            snapshot.units[prod1] = 0
+
+        # The writers only publish a snapshot once every `snapshot_interval` changes
+        marketplace = Marketplace(8, snapshot_interval=3)
+        producer_id = marketplace.register_producer()
+        for _ in range(2):
+            marketplace.publish(producer_id, prod1)
+        self.assertEqual(marketplace.inventory.version, 0)
+        marketplace.publish(producer_id, prod1)
+        snapshot = marketplace.inventory
+        self.assertEqual((snapshot.version, snapshot.available(prod1)), (3, 3))
+        self.assertIs(marketplace.snapshot(), snapshot)
+
+        # A reader that finds the snapshot stale publishes the next one if the lock is free
+        cart_id = marketplace.new_cart()
+        marketplace.add_to_cart(cart_id, prod1)
+        self.assertEqual(marketplace.inventory.version, 3)
+        self.assertEqual(marketplace.snapshot().available(prod1), 2)
+        self.assertEqual(marketplace.inventory.version, 4)
+        self.assertEqual(snapshot.available(prod1), 3)
+
+        # Otherwise, it gets the latest snapshot and the next change publishes a new one
+        marketplace.add_to_cart(cart_id, prod1)
+        with marketplace.add_to_cart_lock:
+            self.assertEqual(marketplace.snapshot().version, 4)
+        marketplace.add_to_cart(cart_id, prod1)
+        self.assertEqual(marketplace.inventory.version, 6)
+        self.assertEqual(marketplace.inventory.available(prod1), 0)
+        self.assertEqual(marketplace.inventory.producer_load(producer_id), 0)
+
+    def test_next_demanded(self):
+        """
+        Tests the unmet demand counters and the `next_demanded()` method.
+        """
+        prod1 = Coffee(name='Indonezia', price=1, acidity=5.05, roast_level='MEDIUM')
+        prod2 = Tea(name='Wild Cherry', price=5, type='Black')
+        prod6 = Tea(name='Jasmine', price=3, type='Green')
+        cart_id = self.marketplace.new_cart()
+
+        # Nothing is in demand, the producer's products are in stock
+        self.assertIsNone(self.marketplace.next_demanded(0))
+
+        # A cart waits for a product out of stock, however many times it retries
+        self.assertFalse(self.marketplace.add_to_cart(cart_id, prod6))
+        self.assertFalse(self.marketplace.add_to_cart(cart_id, prod6))
+        self.assertEqual(self.marketplace.demand(prod6), 1)
+        self.assertEqual(self.marketplace.next_demanded(0, [prod1, prod6]), prod6)
+
+        # Another cart waits for a product in stock, once its only unit is reserved
+        self.assertTrue(self.marketplace.add_to_cart(cart_id, prod2))
+        other_cart_id = self.marketplace.new_cart()
+        self.assertFalse(self.marketplace.add_to_cart(other_cart_id, prod2))
+        self.assertEqual(self.marketplace.next_demanded(0), prod2)
+
+        # The demand is met once the product is published
+        self.marketplace.publish(0, prod6)
+        self.assertTrue(self.marketplace.add_to_cart(cart_id, prod6))
+        self.assertEqual(self.marketplace.demand(prod6), 0)
+
+        # A cart doesn't wait anymore once it's ordered
+        self.marketplace.place_order(other_cart_id)
+        self.assertEqual(self.marketplace.demand(prod2), 0)
+
+        # A cart that waits in several shards of a federation is counted once
+        federation = MarketplaceFederation(8, num_shards=2)
+        cart_id = federation.new_cart()
+        for shard in federation.shards:
+            shard.new_cart(cart_id)
+            shard.add_to_cart(cart_id, prod6)
+        self.assertEqual(federation.demand(prod6), 1)
+
+    def test_record(self):
+        """
+        Tests that the RecordingMarketplace records the calls and their results.
+        """
+        prod1 = Coffee(name='Indonezia', price=1, acidity=5.05, roast_level='MEDIUM')
+        prod6 = Tea(name='Jasmine', price=3, type='Green')
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'trace')
+            marketplace = RecordingMarketplace(self.marketplace, filename)
+            set_caller('cons1')
+            cart_id = marketplace.new_cart()
+            marketplace.add_to_cart(cart_id, prod1)
+
+            # A pool worker that resumes the consumer makes its calls in the same stream
+            def resume():
+                set_caller('cons1')
+                marketplace.add_any_to_cart(cart_id, [prod6, prod1])
+            thread = Thread(target=resume)
+            thread.start()
+            thread.join()
+            marketplace.place_order(cart_id)
+            marketplace.publish(0, prod6)
+            set_caller(None)
+            marketplace.close()
+
+            queue_size_per_producer, calls = read_trace(filename)
+
+        self.assertEqual(queue_size_per_producer, 8)
+        self.assertEqual([call[0] for call in calls],
+                         ['new_cart', 'add_to_cart', 'add_any_to_cart', 'place_order', 'publish'])
+        self.assertEqual([call[1] for call in calls], [0, 0, 0, 0, 1])
+        self.assertEqual(calls[1][4:], (cart_id, 1, [prod1]))
+        self.assertEqual(calls[2][4:], (cart_id, -1, [prod6, prod1]))
+        self.assertEqual(calls[3][5], 1)
+
+    def test_trace(self):
+        """
+        Tests that the Tracer records the spans and the waits of a contended lock.
+        """
+        tracer = Tracer()
+        tracer.enable()
+        lock = tracer.lock('stock_lock')
+
+        with tracer.span('publish', 'marketplace'):
+            lock.acquire()
+        waiter = Thread(target=lambda: lock.release() if lock.acquire() else None,
+                        name='waiter')
+        waiter.start()
+        # The waiter gets its ring buffer once it failed to take the lock right away
+        while len(tracer.buffers) < 2:
+            waiter.join(0.001)
+        lock.release()
+        waiter.join()
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'trace.json')
+            tracer.dump(filename)
+            with open(filename, encoding='utf-8') as trace_file:
+                events = json.load(trace_file)['traceEvents']
+
+        names = {event['tid']: event['args']['name'] for event in events if event['ph'] == 'M'}
+        spans = [(names[event['tid']], event['name'], event['cat'])
+                 for event in events if event['ph'] == 'X']
+        self.assertIn('waiter', names.values())
+        self.assertEqual(sorted(spans), [('MainThread', 'publish', 'marketplace'),
+                                         ('waiter', 'wait stock_lock', 'lock')])
+        self.assertTrue(all(event['dur'] >= 0 for event in events if event['ph'] == 'X'))
+
+        # A disabled tracer hands out plain locks and records nothing
+        self.assertNotIsInstance(Tracer().lock('stock_lock'), TracedLock)
+
+    def test_producer_scheduler(self):
+        """
+        Tests that the scheduler runs the due steps in order, drops the finished producers
+        and wakes up early on `stop()`.
+        """
+        log = []
+
+        def produce(name, wait_times):
+            for step, wait_time in enumerate(wait_times):
+                log.append(f'{name}{step}')
+                yield wait_time
+            log.append(f'{name}{len(wait_times)}')
+
+        def producer(name, wait_times):
+            return SimpleNamespace(produce=lambda: produce(name, wait_times))
+
+        # The steps due at once run in the order they were scheduled
+        scheduler = ProducerScheduler([producer('a', [0, 0]), producer('b', [0])])
+        scheduler.run()
+        self.assertEqual(log, ['a0', 'b0', 'a1', 'b1', 'a2'])
+        self.assertEqual(scheduler.steps, [])
+
+        # The producers due sooner run first, and `stop()` doesn't wait for the later ones
+        log.clear()
+        scheduler = ProducerScheduler([producer('a', [60]), producer('b', [0])], daemon=True)
+        scheduler.start()
+        while len(log) < 3:
+            scheduler.join(0.001)
+        start = monotonic()
+        scheduler.stop()
+        self.assertLess(monotonic() - start, 5)
+        self.assertEqual(log, ['a0', 'b0', 'b1'])
+        self.assertEqual(len(scheduler.steps), 1)
+
+    def test_profiler(self):
+        """
+        Tests that the merged stats tag every function with the role of its threads.
+        """
+        def hot():
+            return sum(range(100))
+
+        def cold():
+            return hot()
+
+        profiler = Profiler()
+        self.assertIsInstance(profiler.profile('consumer'), contextlib.nullcontext)
+        profiler.enable()
+        for _ in range(2):
+            with profiler.profile('consumer'):
+                hot()
+        with profiler.profile('producer'):
+            cold()
+
+        # {tagged function name: number of calls}
+        calls = {name: stats[1] for (_, _, name), stats in profiler.stats().stats.items()
+                 if name.split(' [')[0] in ('hot', 'cold')}
+        self.assertEqual(calls, {'hot [consumer]': 2, 'hot [producer]': 1, 'cold [producer]': 1})
+
+        stream = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            profiler.report(os.path.join(directory, 'test.pstats'), stream=stream)
+            self.assertTrue(os.path.exists(os.path.join(directory, 'test.pstats')))
+        self.assertIn('consumer: 2 threads', stream.getvalue())
+        self.assertIn('producer: 1 threads', stream.getvalue())
+
+    def test_order_summary(self):
+        """
+        Tests the cart aggregates and the summary returned by `place_order()`.
+        """
+        prod1 = Coffee(name='Indonezia', price=1, acidity=5.05, roast_level='MEDIUM')
+        prod2 = Tea(name='Wild Cherry', price=5, type='Black')
+        prod5 = Tea(name='Linden', price=9, type='Herbal')
+        cart_id = self.marketplace.new_cart()
+        for product in (prod1, prod2, prod5):
+            self.marketplace.add_to_cart(cart_id, product)
+        self.marketplace.remove_from_cart(cart_id, prod2)
+
+        summary = self.marketplace.place_order(cart_id, summary=True)
+        self.assertEqual(summary.total_price, 10)
+        self.assertEqual(summary.num_items, 2)
+        self.assertEqual(summary.types, {'Coffee': 1, 'Tea': 1})
+        self.assertEqual(summary.producers, {0: 2})
+
+    def test_federation(self):
+        """
+        Tests the home shards of the products and the cart ids shared with the shards.
+        """
+        federation = MarketplaceFederation(8, num_shards=2)
+        prod1 = Coffee(name='Indonezia', price=1, acidity=5.05, roast_level='MEDIUM')
+        prod2 = Tea(name='Wild Cherry', price=5, type='Black')
+        id0, id1 = federation.register_producer(), federation.register_producer()
+        federation.publish(id1, prod1)
+        federation.publish(id0, prod2)
+        self.assertEqual(federation.product_shard(prod1), 1)
+        self.assertEqual(federation.product_shard(prod2), 0)
+
+        cart_id = federation.new_cart()
+        self.assertTrue(federation.add_to_cart(cart_id, prod1))
+        self.assertTrue(federation.add_to_cart(cart_id, prod2))
+        self.assertEqual(federation.shard_carts[cart_id], {0: cart_id, 1: cart_id})
+        self.assertEqual(sorted(federation.place_order(cart_id), key=repr), [prod1, prod2])
+
+    def test_consumer_pool_failure(self):
+        """
+        Tests that a consumer that fails is retired instead of blocking the other workers.
+        """
+        def shop(fail):
+            yield 0
+            if fail:
+                raise RuntimeError('consumer failed')
+
+        done = []
+        consumers = [SimpleNamespace(shop=lambda fail=fail: shop(fail)) for fail in (True, False)]
+        pool = ConsumerPool(consumers, 2)
+        worker = Thread(target=lambda: done.append(pool.run() is None), daemon=True)
+        with contextlib.redirect_stderr(io.StringIO()):
+            worker.start()
+            worker.join(5)
+        self.assertEqual(done, [True])
+        self.assertEqual(pool.pending, 0)
+
+    def test_receipt(self):
+        """
+        Tests the receipt returned by `place_order()` and its expansion to the legacy format.
+        """
+        prod1 = Coffee(name='Indonezia', price=1, acidity=5.05, roast_level='MEDIUM')
+        prod2 = Tea(name='Wild Cherry', price=5, type='Black')
+        self.marketplace.publish(0, prod1)
+        cart_id = self.marketplace.new_cart()
+        for product in (prod1, prod2, prod1):
+            self.marketplace.add_to_cart(cart_id, product)
+        self.marketplace.remove_from_cart(cart_id, prod2)
+
+        receipt = self.marketplace.place_order(cart_id, receipt=True)
+        self.assertEqual(receipt, {prod1: 2})
+
+        text = '\n'.join(format_receipts({('cons1', 'id1'): 2, ('cons2', 'id2'): 1}))
+        self.assertEqual(text, 'cons1 id1 2\ncons2 id2 1')
+        self.assertTrue(is_receipt(text))
+        self.assertEqual(parse_receipts(text + '\ncons1 id1 1'),
+                         {('cons1', 'id1'): 3, ('cons2', 'id2'): 1})
+
+        lines = expand(parse_receipts(text), {'id1': prod1, 'id2': prod2})
+        self.assertEqual(lines, [f'cons1 bought {prod1}'] * 2 + [f'cons2 bought {prod2}'])
+        self.assertFalse(is_receipt('\n'.join(lines)))
+
+    def test_combining(self):
+        """
+        Tests that the contended reservations are applied in batches by a combiner.
+        """
+        marketplace = Marketplace(8, combining=True)
+        prod1 = Coffee(name='Indonezia', price=1, acidity=5.05, roast_level='MEDIUM')
+        id_ = marketplace.register_producer()
+        for _ in range(3):
+            marketplace.publish(id_, prod1)
+        cart_ids = [marketplace.new_cart() for _ in range(4)]
+        results = {}
+        posted = Event()
+
+        class Publications(deque):
+            """
+            The publication list of `prod1`, that tells when all the requests are posted.
+            """
+            def append(self, request):
+                super().append(request)
+                if len(self) == len(cart_ids):
+                    posted.set()
+
+        marketplace.combiner.publications[prod1] = Publications()
+
+        # The threads post their requests while the stock lock is held
+        with marketplace.add_to_cart_lock:
+            threads = [Thread(target=lambda cart_id=cart_id: results.update(
+                {cart_id: marketplace.add_to_cart(cart_id, prod1)})) for cart_id in cart_ids]
+            for thread in threads:
+                thread.start()
+            self.assertTrue(posted.wait(5))
+        for thread in threads:
+            thread.join()
+
+        # A single combiner applies the whole batch once the lock is released
+        self.assertEqual(sorted(results.values()), [False, True, True, True])
+        self.assertEqual(marketplace.combiner.combined, 4)
+        self.assertEqual(marketplace.combiner.batches, 1)
+
+    def test_autotune(self):
+        """
+        Tests the decisions of the AutoTuner, within their bounds.
+        """
+        producer = SimpleNamespace(producer_id=0, republish_wait_time=0.2)
+        consumer = SimpleNamespace(retry_wait_time=0.1)
+        tuner = AutoTuner(self.marketplace, [producer], [consumer], capacity=(1, 9),
+                          stream=io.StringIO())
+        delta = dict.fromkeys(self.marketplace.stats, 0)
+
+        # The producers are rejected while the consumers fail: more capacity, longer retries
+        tuner.tune(1, {**delta, 'publish_rejected': 9, 'published': 1,
+                       'add_failed': 9, 'reserved': 1})
+        self.assertEqual(self.marketplace.queue_size_per_producer, 9)
+        self.assertAlmostEqual(consumer.retry_wait_time, 0.15)
+        tuner.tune(2, {**delta, 'publish_rejected': 9, 'published': 1,
+                       'add_failed': 9, 'reserved': 1})
+        self.assertEqual(self.marketplace.queue_size_per_producer, 9)
+
+        # The producers are rejected while the consumers are served: slower producers
+        tuner.tune(3, {**delta, 'publish_rejected': 9, 'published': 1, 'reserved': 10})
+        self.assertAlmostEqual(producer.republish_wait_time, 0.3)
+        self.assertAlmostEqual(consumer.retry_wait_time, 0.15)
+        self.assertEqual(len(tuner.decisions), 5)
+
+        # Idle periods, or periods without any add_to_cart(), change nothing
+        for now in range(4, 14):
+            tuner.tune(now, delta)
+            tuner.tune(now, {**delta, 'published': 5})
+        self.assertEqual(self.marketplace.queue_size_per_producer, 9)
+        self.assertAlmostEqual(producer.republish_wait_time, 0.3)
+        self.assertAlmostEqual(consumer.retry_wait_time, 0.15)
+        self.assertEqual(len(tuner.decisions), 5)
@@ -0,0 +1,165 @@
+"""
+This module represents the Tracer.
+"""
+
+from contextlib import nullcontext
+from collections import deque
+from functools import wraps
+from json import dump
+from threading import Lock, local, current_thread
+from time import perf_counter_ns
+
+class Span:
+    """
+    Records the time spent in a `with` block in the calling thread's ring buffer.
+    """
+
+    def __init__(self, buffer, name, category):
+        """
+        Constructor
+        """
+        self.buffer = buffer
+        self.name = name
+        self.category = category
+        self.start = 0
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.buffer.append((self.name, self.category, self.start, perf_counter_ns()))
+
+
+class TracedLock:
+    """
+    A Lock that records the time spent waiting for it, when it is contended.
+    """
+
+    def __init__(self, tracer, name):
+        """
+        Constructor
+        """
+        self.tracer = tracer
+        self.name = f'wait {name}'
+        self.lock = Lock()
+
+    def acquire(self, blocking=True, timeout=-1):
+        """
+        Acquires the lock, like `Lock.acquire()`.
+        """
+        # Only the waits of a contended lock are recorded
+        if self.lock.acquire(False):
+            return True
+        if not blocking:
+            return False
+
+        with self.tracer.span(self.name, 'lock'):
+            return self.lock.acquire(True, timeout)
+
+    def release(self):
+        """
+        Releases the lock.
+        """
+        self.lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class Tracer:
+    """
+    Class that records begin/end events into per-thread ring buffers and dumps
+    them in the Chrome trace-event format. It's disabled by default, in which
+    case it costs a flag check per traced call.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.enabled = False
+        self.capacity = 0 # Number of events kept for each thread
+        self.local = local() # The calling thread's ring buffer
+        self.buffers = [] # [(thread ID, thread name, ring buffer)]
+        self.buffers_lock = Lock() # Lock for `buffers`
+
+    def enable(self, capacity=1 << 16):
+        """
+        Enables tracing. Locks created afterwards by `lock()` record their waits.
+
+        :type capacity: Int
+        :param capacity: the number of events kept for each thread
+        """
+        self.capacity = capacity
+        self.enabled = True
+
+    def buffer(self):
+        """
+        Returns the ring buffer of the calling thread.
+        """
+        try:
+            return self.local.buffer
+        except AttributeError:
+            thread = current_thread()
+            self.local.buffer = deque(maxlen=self.capacity)
+            with self.buffers_lock:
+                self.buffers.append((thread.ident, thread.name, self.local.buffer))
+            return self.local.buffer
+
+    def span(self, name, category):
+        """
+        Returns a context manager that traces the `with` block.
+        """
+        if not self.enabled:
+            return nullcontext()
+
+        return Span(self.buffer(), name, category)
+
+    def lock(self, name):
+        """
+        Returns a new lock, that records its waits if tracing is enabled.
+        """
+        return TracedLock(self, name) if self.enabled else Lock()
+
+    def dump(self, filename):
+        """
+        Writes the recorded events to `filename`, in the Chrome trace-event JSON format.
+        """
+        events = []
+        with self.buffers_lock:
+            buffers = list(self.buffers)
+
+        for tid, thread_name, buffer in buffers:
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid,
+                           'args': {'name': thread_name}})
+            events += [{'name': name, 'cat': category, 'ph': 'X', 'pid': 1, 'tid': tid,
+                        'ts': start / 1000, 'dur': (end - start) / 1000}
+                       for name, category, start, end in list(buffer)]
+
+        with open(filename, 'w', encoding='utf-8') as trace_file:
+            dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+
+
+TRACER = Tracer()
+
+
+def traced(category):
+    """
+    Decorator that traces every call of the decorated method.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return method(*args, **kwargs)
+
+            with Span(TRACER.buffer(), method.__name__, category):
+                return method(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
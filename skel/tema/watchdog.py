@@ -0,0 +1,141 @@
+"""
+This module represents the Watchdog.
+"""
+
+import os
+import sys
+from collections.abc import Sequence
+from threading import Thread, Event
+
+class Watchdog(Thread):
+    """
+    Class that watches the global progress of the Marketplace. When nothing changes
+    the stock within `window` seconds while consumers are still waiting, the run
+    is stalled: it prints a diagnosis and applies the recovery policy:
+        - 'none': only diagnose
+        - 'abort': exit right away, so the run fails fast instead of timing out
+        - 'evict': discard the products nobody waits for from the full producers,
+          so that they can publish the products the consumers wait for
+    """
+
+    POLICIES = ('none', 'abort', 'evict')
+
+    def __init__(self, marketplace, consumers, window=5.0, policy='none',
+                 stream=sys.stderr, **kwargs):
+        """
+        Constructor.
+
+        :type marketplace: Marketplace
+        :param marketplace: the marketplace to watch
+
+        :type consumers: List
+        :param consumers: the consumers, to find out what they wait for
+
+        :type window: Float
+        :param window: the number of seconds without progress after which the run is stalled
+
+        :type policy: String
+        :param policy: the recovery policy, one of `Watchdog.POLICIES`
+
+        :type kwargs:
+        :param kwargs: other arguments that are passed to the Thread's __init__()
+        """
+        Thread.__init__(self, **kwargs)
+        self.marketplace = marketplace
+        self.consumers = consumers
+        self.window = window
+        self.policy = policy
+        self.stream = stream
+        self.stalls = 0 # Number of stalls detected
+        self.stopped = Event() # Set when the watchdog must stop
+
+    def stop(self):
+        """
+        Stops the watchdog and waits for it to finish.
+        """
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        progress = self.marketplace.progress
+        while not self.stopped.wait(self.window):
+            if self.marketplace.progress != progress:
+                progress = self.marketplace.progress
+                continue
+
+            waiting = {consumer.name: consumer.waiting_for for consumer in self.consumers
+                       if consumer.waiting_for is not None}
+            if not waiting:
+                continue
+
+            self.stalls += 1
+            self.diagnose(waiting)
+            self.recover(waiting)
+
+    def diagnose(self, waiting):
+        """
+        Prints the waiting consumers, the full producers and the blocking products.
+
+        :type waiting: Dict
+        :param waiting: {consumer name: product (or alternatives) it waits for}
+        """
+        stock = self.marketplace.stock_by_producer()
+        queue_size = self.marketplace.queue_size_per_producer
+
+        lines = [f'STALL: no progress for {self.window}s']
+        lines.append(f'waiting consumers ({len(waiting)}):')
+        lines += [f'    {name} waits for {product}' for name, product in sorted(waiting.items())]
+
+        full = {producer_id: units for producer_id, units in stock.items()
+                if sum(units.values()) >= queue_size}
+        lines.append(f'full producers ({len(full)}):')
+        lines += [f'    producer {producer_id}: '
+                  + ', '.join(f'{count} x {product}' for product, count in units.items())
+                  for producer_id, units in sorted(full.items())]
+
+        wanted = self.wanted(waiting)
+        blocking = {product: count for product, count in wanted.items()
+                    if self.marketplace.available(product) == 0}
+        lines.append(f'blocking products (waited for, out of stock) ({len(blocking)}):')
+        lines += [f'    {product}: {count} consumers' for product, count in blocking.items()]
+
+        print('\n'.join(lines), file=self.stream, flush=True)
+
+    @staticmethod
+    def wanted(waiting):
+        """
+        Returns the number of consumers waiting for every product.
+        """
+        wanted = {}
+        for product in waiting.values():
+            # The alternatives of an 'add_any' operation are any Sequence (a list, or a
+            # lazily decoded table of a binary scenario), while the products are dataclasses
+            for alternative in (product if isinstance(product, Sequence) else [product]):
+                wanted[alternative] = wanted.get(alternative, 0) + 1
+
+        return wanted
+
+    def recover(self, waiting):
+        """
+        Applies the recovery policy.
+        """
+        if self.policy == 'abort':
+            print('STALL: aborting', file=self.stream, flush=True)
+            sys.stdout.flush()
+            # The consumers are stuck and can't be joined, so exit without waiting
+            # for them (`sys.exit()` would): `os._exit()` is the documented way
+            os._exit(1) # pylint: disable=protected-access
+
+        if self.policy == 'evict':
+            wanted = self.wanted(waiting)
+            queue_size = self.marketplace.queue_size_per_producer
+            for producer_id, units in self.marketplace.stock_by_producer().items():
+                if sum(units.values()) < queue_size:
+                    continue
+                for product, count in units.items():
+                    if product not in wanted:
+                        for _ in range(count):
+                            self.marketplace.discard(producer_id, product)
+                        print(f'STALL: discarded {count} x {product} of producer {producer_id}',
+                              file=self.stream, flush=True)
@@ -14,9 +14,11 @@ Script input
 """
 import argparse
 import random
+from collections import Counter
 from json import loads, dumps
 
 from tema.product import *  # pylint: disable=wildcard-import, unused-wildcard-import
+from tema.receipt import format_receipts
 from test_utils import *  # pylint: disable=wildcard-import, unused-wildcard-import
 
 
@@ -301,10 +303,12 @@ def compute_expected_cart(operations):
     return expected_cart
 
 
-def generate_in_out_test_files(test_name):
+def generate_in_out_test_files(test_name, legacy=True):
     """
-    Creates two files for the given test: the input file and the reference output file
+    Creates the files for the given test: the input file, the reference receipts
+    and, with `legacy`, the reference output file
     :param test_name: the name (excluding the extension) given to all the files of the test
+    :param legacy: also write the reference output in the legacy format, a line per unit
     :return: nothing
     """
     filename = f'{TESTS_DIR}/{test_name}.json'
@@ -312,6 +316,15 @@ def generate_in_out_test_files(test_name):
     with open(filename) as json_file:
         conf = loads(json_file.read())
 
+    # write to receipts file (tests/{test_name}.ref.counts)
+    receipts = Counter()
+    for consumer in conf['consumers']:
+        for cart in consumer['carts']:
+            for product_id, count in cart['expected_cart'].items():
+                receipts[consumer['name'], product_id] += count
+    with open(f'{TESTS_DIR}/{test_name}.ref.counts', 'w', encoding='utf-8') as receipts_file:
+        print('\n'.join(format_receipts(receipts)), file=receipts_file)
+
     # turn product definitions into actual products
     products = {}
     for k, prod_dict in conf['products'].items():
@@ -325,17 +338,18 @@ def generate_in_out_test_files(test_name):
                                      for k, v
                                      in cart['expected_cart'].items()}
 
-    lines = []
-    for consumer in conf['consumers']:
-        print("consumer" + str(consumer))
-        for cart in consumer['carts']:
-            for product, count in cart['expected_cart'].items():
-                lines += ([f'{consumer["name"]} bought {product}'] * count)
-
-    # write to output file (tests/{test_name}.out)
-    with open(f'{TESTS_DIR}/{test_name}.ref.out', 'w') as output_file:
-        lines.sort()
-        print('\n'.join(lines), file=output_file)
+    if legacy:
+        lines = []
+        for consumer in conf['consumers']:
+            print("consumer" + str(consumer))
+            for cart in consumer['carts']:
+                for product, count in cart['expected_cart'].items():
+                    lines += ([f'{consumer["name"]} bought {product}'] * count)
+
+        # write to output file (tests/{test_name}.out)
+        with open(f'{TESTS_DIR}/{test_name}.ref.out', 'w') as output_file:
+            lines.sort()
+            print('\n'.join(lines), file=output_file)
 
     for consumer in conf['consumers']:
         consumer['carts'] = [d['ops'] for d in consumer['carts']]
@@ -6,26 +6,30 @@ Assignment 1
 March 2020
 """
 
-import sys
+from argparse import ArgumentParser
 from json import loads
 
 from tema.producer import Producer
 from tema.consumer import Consumer
+from tema.consumer_pool import ConsumerPool
+from tema.producer_scheduler import ProducerScheduler
+from tema.tracer import TRACER
+from tema.watchdog import Watchdog
+from tema.profiler import PROFILER
 from tema.marketplace import Marketplace
+from tema.admission import AdmissionController
+from tema.autotuner import AutoTuner
+from tema.quota import ProductQuota
+from tema.recorder import RecordingMarketplace
+from tema.federation import MarketplaceFederation
 from tema.product import Product, Coffee, Tea
+from scenario import BinaryScenario, BINARY_EXTENSION
 
 
-def main():
+def load_json_config(filename):
     """
-        Convert the market_configuration input file into specific models:
-        Producer, Consumer, Marketplace
+        Load a `.in` scenario file and resolve its product ids into products
     """
-    try:
-        filename = sys.argv[1]
-    except IndexError:
-        print("no input file specified")
-        raise SystemExit
-
     with open(filename) as input_file:
         market_config = loads(input_file.read())
 
@@ -36,6 +40,7 @@ def main():
         params = {k: products_dict[k] for k in products_dict.keys() if k != 'product_type'}
         products[k] = globals()[products_dict['product_type']](**params)
     del market_config['products']
+    market_config['product_ids'] = {product: k for k, product in products.items()}
 
     # turn product ids into products in producers
     for producer in market_config['producers']:
@@ -44,30 +49,174 @@ def main():
                                 in producer['products']]
 
     # turn product ids into products in consumer order lists and expected carts
+    # ('add_any' operations list their alternatives, in the order of preference)
     for consumer in market_config['consumers']:
         for cart in consumer['carts']:
             for operation in cart:
-                operation['product'] = products[operation['product']]
+                if 'products' in operation:
+                    operation['products'] = [products[i] for i in operation['products']]
+                else:
+                    operation['product'] = products[operation['product']]
+
+    return market_config
+
+
+def load_config(filename):
+    """
+        Load a scenario file, choosing the loader by the file extension:
+        binary scenarios (see scenario.py) are memory-mapped and decoded lazily
+    """
+    if filename.endswith(BINARY_EXTENSION):
+        return BinaryScenario(filename).market_config()
+
+    return load_json_config(filename)
+
+
+def main():
+    """
+        Convert the market_configuration input file into specific models:
+        Producer, Consumer, Marketplace
+    """
+    parser = ArgumentParser()
+    parser.add_argument('filename', help="the scenario file (.in or binary)")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="run the consumers on a pool of this many worker threads "
+                             "instead of one thread per consumer")
+    parser.add_argument('--scheduler', action='store_true',
+                        help="drive all the producers from a single timer thread "
+                             "instead of one thread per producer")
+    parser.add_argument('--trace', metavar='TRACE_FILE',
+                        help="record a timeline of the run in the Chrome trace-event format")
+    parser.add_argument('--profile', action='store_true',
+                        help="profile every producer and consumer thread and write "
+                             "the merged stats to a pstats file")
+    parser.add_argument('--profile-file', metavar='PSTATS_FILE', default='test.pstats',
+                        help="the pstats file written by --profile (default: test.pstats)")
+    parser.add_argument('--events', metavar='EVENTS_FILE',
+                        help="record the marketplace events to a .npz file, for analytics.py")
+    parser.add_argument('--admission', action='store_true',
+                        help="shed the add_to_cart() retries with the default admission control")
+    parser.add_argument('--shards', type=int, default=0,
+                        help="partition the producers across this many marketplace shards")
+    parser.add_argument('--quota', type=float, metavar='SLOTS',
+                        help="cap the slots of a product in a producer's queue "
+                             "(a share of the queue if less than 1)")
+    parser.add_argument('--demand', action='store_true',
+                        help="let the producers publish first the products the consumers wait for")
+    parser.add_argument('--combining', action='store_true',
+                        help="batch the contended reservations and returns of every product")
+    parser.add_argument('--snapshot-interval', type=int, default=64, metavar='CHANGES',
+                        help="publish an immutable snapshot of the stock every CHANGES changes "
+                             "(default: 64)")
+    parser.add_argument('--record', metavar='FILE',
+                        help="record every call to the marketplace into a trace (see replay.py)")
+    parser.add_argument('--autotune', action='store_true',
+                        help="tune the queue size and the wait times while the test runs")
+    parser.add_argument('--autotune-period', type=float, default=0.5, metavar='PERIOD',
+                        help="the seconds between two tunings of --autotune (default: 0.5)")
+    parser.add_argument('--watchdog', type=float, metavar='SECONDS',
+                        help="diagnose the run if nothing progresses for this many seconds")
+    parser.add_argument('--recovery', choices=Watchdog.POLICIES, default='none',
+                        help="what the watchdog does once the run is stalled")
+    parser.add_argument('--receipts', action='store_true',
+                        help="print the `consumer product_id count` receipts (see receipt.py)")
+    args = parser.parse_args()
+
+    if args.profile:
+        PROFILER.enable()
+
+    # Tracing must be enabled before the marketplace creates its locks
+    if args.trace:
+        TRACER.enable()
+
+    market_config = load_config(args.filename)
+    product_ids = market_config['product_ids'] if args.receipts else None
 
     # build the marketplace
-    marketplace = Marketplace(**market_config['marketplace'])
+    event_log = None
+    if args.events:
+        # NumPy is only needed when the events are recorded
+        from tema.event_log import EventLog  # pylint: disable=import-outside-toplevel
+        event_log = EventLog()
+    admission = AdmissionController() if args.admission else None
+    quota = None
+    if args.quota:
+        quota = ProductQuota(args.quota, market_config['marketplace']['queue_size_per_producer'])
+    if args.shards > 0:
+        marketplace = MarketplaceFederation(**market_config['marketplace'],
+                                            num_shards=args.shards, event_log=event_log,
+                                            admission=admission, quota=quota,
+                                            combining=args.combining,
+                                            snapshot_interval=args.snapshot_interval)
+    else:
+        marketplace = Marketplace(**market_config['marketplace'], event_log=event_log,
+                                  admission=admission, quota=quota,
+                                  combining=args.combining,
+                                  snapshot_interval=args.snapshot_interval)
+
+    if args.record:
+        marketplace = RecordingMarketplace(marketplace, args.record)
 
     # build and start the producers
-    producers = [Producer(**p_market_config, marketplace=marketplace, daemon=True)
+    producers = [Producer(**p_market_config, marketplace=marketplace,
+                          demand_driven=args.demand, daemon=True)
                  for p_market_config in market_config['producers']]
 
-    for producer in producers:
-        producer.start()
+    if args.scheduler:
+        scheduler = ProducerScheduler(producers, name='producer-scheduler', daemon=True)
+        scheduler.start()
+    else:
+        for producer in producers:
+            producer.start()
 
     # build and start the consumers
-    consumers = [Consumer(**c_market_config, marketplace=marketplace)
+    consumers = [Consumer(**c_market_config, marketplace=marketplace, product_ids=product_ids)
                  for c_market_config in market_config['consumers']]
 
-    for consumer in consumers:
-        consumer.start()
+    if args.watchdog:
+        watchdog = Watchdog(marketplace, consumers, args.watchdog, args.recovery,
+                            name='watchdog', daemon=True)
+        watchdog.start()
+
+    if args.autotune:
+        autotuner = AutoTuner(marketplace, producers, consumers, args.autotune_period,
+                              name='autotuner', daemon=True)
+        autotuner.start()
+
+    if args.workers > 0:
+        ConsumerPool(consumers, args.workers).run()
+    else:
+        for consumer in consumers:
+            consumer.start()
+
+        for consumer in consumers:
+            consumer.join()
+
+    if args.watchdog:
+        watchdog.stop()
+
+    if args.autotune:
+        autotuner.stop()
+
+    # There is no more demand once all the consumers finished
+    if args.scheduler:
+        scheduler.stop()
+    else:
+        for producer in producers:
+            producer.stop()
+
+    if args.record:
+        marketplace.close()
+
+    if args.trace:
+        TRACER.dump(args.trace)
+
+    if args.events:
+        event_log.save(args.events)
 
-    for consumer in consumers:
-        consumer.join()
+    # The stats are merged once every profiled thread finished
+    if args.profile:
+        PROFILER.report(args.profile_file)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,90 @@
+"""
+This module represents the Unittesting component of the EventLog and of the analytics.
+"""
+
+import unittest
+import numpy as np
+from tema.event_log import EventLog
+from analytics import duration, throughput, fill_rate, backlog, wait_latencies, percentiles
+
+
+def events(*records):
+    """
+    Returns the events of the (op, time, producer_id, product_id, cart_id) records.
+    """
+    return np.array([(EventLog.OPS.index(op), time, producer_id, product_id, cart_id)
+                     for op, time, producer_id, product_id, cart_id in records],
+                    dtype=EventLog.DTYPE)
+
+
+class AnalyticsTestCase(unittest.TestCase):
+    """
+    Class that represents a Unittester. It's used for testing purposes.
+    """
+
+    def test_record(self):
+        """
+        Tests that the records are appended past the capacity, with interned products.
+        """
+        event_log = EventLog(capacity=2)
+        event_log.record('publish', 'Linden', producer_id=0)
+        event_log.record('new_cart', cart_id=1)
+        event_log.record('add', 'Linden', producer_id=0, cart_id=1)
+        event_log.record('publish', 'Wild Cherry', producer_id=1)
+
+        recorded = event_log.events()
+        self.assertEqual(len(event_log.records), 4)
+        self.assertEqual([EventLog.OPS[op] for op in recorded['op']],
+                         ['publish', 'new_cart', 'add', 'publish'])
+        self.assertEqual(list(recorded['product']), [0, -1, 0, 1])
+        self.assertEqual(list(recorded['producer']), [0, -1, 0, 1])
+        self.assertEqual(list(recorded['cart']), [-1, 1, 1, -1])
+        self.assertTrue(np.all(np.diff(recorded['time']) >= 0))
+        self.assertEqual(event_log.products, ['Linden', 'Wild Cherry'])
+
+        # The events are a copy, that the next records don't change
+        event_log.record('order', 'Linden', producer_id=0, cart_id=1)
+        self.assertEqual(len(recorded), 4)
+        self.assertEqual(len(event_log.events()), 5)
+
+    def test_throughput_and_fill_rate(self):
+        """
+        Tests the rates of every producer, including the ones without orders or publications.
+        """
+        market = events(('publish', 0, 0, 0, -1), ('publish', 0, 0, 0, -1),
+                        ('publish', 0, 2, 1, -1), ('publish_rejected', 1, 3, 1, -1),
+                        ('order', 2, 0, 0, 1))
+
+        self.assertEqual(duration(market), 2)
+        np.testing.assert_array_equal(throughput(market, 'producer', minlength=4),
+                                      [0.5, 0, 0, 0])
+        np.testing.assert_array_equal(fill_rate(market, minlength=4), [0.5, 0, 0, 0])
+        np.testing.assert_array_equal(throughput(market, 'product', minlength=2), [0.5, 0])
+
+    def test_backlog(self):
+        """
+        Tests the number of units in stock over time.
+        """
+        market = events(('publish', 0, 0, 0, -1), ('publish', 1, 0, 1, -1),
+                        ('add', 2, 0, 0, 1), ('remove', 3, 0, 0, 1))
+
+        times, stock = backlog(market, num_points=4)
+        np.testing.assert_array_equal(times, [0, 1, 2, 3])
+        np.testing.assert_array_equal(stock, [1, 2, 1, 2])
+
+        _, stock = backlog(market, num_points=4, product=1)
+        np.testing.assert_array_equal(stock, [1, 1, 1, 1])
+
+    def test_wait_latencies(self):
+        """
+        Tests the time to acquire every unit and its quantiles per product.
+        """
+        market = events(('add_failed', 1, -1, 0, 1), ('add_failed', 2, -1, 0, 1),
+                        ('add', 3, 0, 2, 2), ('add', 4, 0, 0, 1), ('add', 5, 0, 0, 1))
+
+        product_ids, latencies = wait_latencies(market)
+        np.testing.assert_array_equal(product_ids, [0, 0, 2])
+        np.testing.assert_array_equal(latencies, [3, 0, 0])
+
+        np.testing.assert_array_equal(percentiles(product_ids, latencies, (0, 1)),
+                                      [[0, 3], [np.nan, np.nan], [0, 0]])
@@ -0,0 +1,100 @@
+"""
+This module represents the Unittesting component of the feasibility analysis.
+"""
+
+import io
+import unittest
+import numpy as np
+from feasibility import Scenario, expected_counts, supply_and_demand, worst_occupancy, \
+    max_cycles, deadlocks, report, write_counts
+
+PRODUCTS = {'id1': {'product_type': 'Tea', 'name': 'Linden', 'price': 9, 'type': 'Herbal'},
+            'id2': {'product_type': 'Tea', 'name': 'Wild Cherry', 'price': 5, 'type': 'Black'}}
+
+
+def scenario(producers, consumers, queue_size_per_producer):
+    """
+    Returns a Scenario of producers {name: [(product_id, quantity), ...]}
+    and consumers {name: [[(type, product_id, quantity), ...], ...]}.
+    """
+    return Scenario({
+        'products': PRODUCTS,
+        'producers': [{'name': name, 'republish_wait_time': 0.1,
+                       'products': [[product_id, quantity, 0.1]
+                                    for product_id, quantity in products]}
+                      for name, products in producers.items()],
+        'consumers': [{'name': name, 'retry_wait_time': 0.1,
+                       'carts': [[{'type': type_, 'products': product_id, 'quantity': quantity}
+                                  if type_ == 'add_any' else
+                                  {'type': type_, 'product': product_id, 'quantity': quantity}
+                                  for type_, product_id, quantity in cart] for cart in carts]}
+                      for name, carts in consumers.items()],
+        'marketplace': {'queue_size_per_producer': queue_size_per_producer}})
+
+
+class FeasibilityTestCase(unittest.TestCase):
+    """
+    Class that represents a Unittester. It's used for testing purposes.
+    """
+
+    def test_expected_counts(self):
+        """
+        Tests that every cart keeps the net quantity of its products, summed per consumer.
+        """
+        market = scenario({'prod1': [('id1', 5), ('id2', 5)]},
+                          {'cons1': [[('add', 'id1', 3), ('remove', 'id1', 1)],
+                                     [('add', 'id1', 1), ('add', 'id2', 1),
+                                      ('remove', 'id2', 2)]],
+                           'cons2': [[('add', 'id2', 2)]]}, 8)
+
+        output = io.StringIO()
+        write_counts(market, expected_counts(market), output)
+        self.assertEqual(output.getvalue(), 'cons1 id1 3\ncons2 id2 2\n')
+
+    def test_worst_occupancy(self):
+        """
+        Tests the occupancy of the queues when the producers first publish every product.
+        """
+        market = scenario({'prod1': [('id1', 3), ('id2', 2)], 'prod2': [('id2', 9)]}, {}, 8)
+
+        occupancy = worst_occupancy(market)
+        np.testing.assert_array_equal(occupancy, [[0, 3], [np.inf, 0]])
+
+    def test_deadlocks(self):
+        """
+        Tests the products that deadlock for sure and the ones that may deadlock.
+        """
+        # The consumers never buy the 10 units of id1 beyond the 6 they reserve,
+        # so the producer fills up during its second cycle
+        market = scenario({'prod1': [('id1', 10), ('id2', 2)]},
+                          {'cons1': [[('add', 'id2', 18), ('add', 'id1', 6)]]}, 8)
+        supply = supply_and_demand(market)
+        cycles = max_cycles(market, supply)
+        self.assertEqual(list(cycles), [2])
+        certain, possible = deadlocks(market, supply, cycles, worst_occupancy(market))
+        self.assertEqual(certain, [(1, 4)])
+        self.assertEqual(possible, [])
+        self.assertFalse(report(market, io.StringIO()))
+
+        # With enough demand for id1, the producer can only be full before its first id2
+        # if the consumers don't buy any id1 in time
+        market = scenario({'prod1': [('id1', 10), ('id2', 2)]},
+                          {'cons1': [[('add', 'id1', 100), ('add', 'id2', 18)]]}, 10)
+        supply = supply_and_demand(market)
+        cycles = max_cycles(market, supply)
+        certain, possible = deadlocks(market, supply, cycles, worst_occupancy(market))
+        self.assertEqual(certain, [])
+        self.assertEqual(possible, [1])
+        self.assertTrue(report(market, io.StringIO()))
+
+    def test_add_any(self):
+        """
+        Tests that the 'add_any' operations only count as reserved units.
+        """
+        market = scenario({'prod1': [('id1', 1), ('id2', 1)]},
+                          {'cons1': [[('add_any', ['id2', 'id1'], 2), ('add', 'id1', 1)]]}, 4)
+
+        supply = supply_and_demand(market)
+        np.testing.assert_array_equal(supply['reserved'], [3, 2])
+        np.testing.assert_array_equal(supply['kept'], [1, 0])
+        self.assertEqual(market.flexible_ops, 1)
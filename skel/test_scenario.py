@@ -0,0 +1,97 @@
+"""
+This module represents the Unittesting component of the binary scenarios.
+"""
+
+import json
+import os
+import struct
+import tempfile
+import unittest
+from scenario import compile_scenario, BinaryScenario, HEADER, MAGIC, VERSION
+from test import load_json_config
+
+MARKET_CONFIG = {
+    'products': {'id1': {'product_type': 'Tea', 'name': 'Linden', 'price': 9, 'type': 'Herbal'},
+                 'id2': {'product_type': 'Coffee', 'name': 'Indonezia', 'price': 1,
+                         'acidity': 5.05, 'roast_level': 'MEDIUM'}},
+    'producers': [{'name': 'prod1', 'republish_wait_time': 0.1,
+                   'products': [['id1', 2, 0.2], ['id2', 3, 0.3]]}],
+    'consumers': [{'name': 'cons1', 'retry_wait_time': 0.4,
+                   'carts': [[{'type': 'add', 'product': 'id1', 'quantity': 2},
+                              {'type': 'remove', 'product': 'id1', 'quantity': 1}],
+                             [{'type': 'add_any', 'products': ['id2', 'id1'], 'quantity': 3}]]},
+                  {'name': 'cons2', 'retry_wait_time': 0.5, 'carts': []}],
+    'marketplace': {'queue_size_per_producer': 8}}
+
+
+def materialize(market_config):
+    """
+    Returns the producers and the consumers of a scenario as plain lists,
+    whether their schedules and carts are lists or lazy views.
+    """
+    producers = [{**producer, 'products': list(producer['products'])}
+                 for producer in market_config['producers']]
+    consumers = [{**consumer,
+                  'carts': [[{key: list(value) if key == 'products' else value
+                              for key, value in operation.items()} for operation in cart]
+                            for cart in consumer['carts']]}
+                 for consumer in market_config['consumers']]
+
+    return producers, consumers
+
+
+class ScenarioTestCase(unittest.TestCase):
+    """
+    Class that represents a Unittester. It's used for testing purposes.
+    """
+
+    def setUp(self):
+        """
+        Writes the scenario as a `.in` file and as a binary one.
+        """
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.json_filename = os.path.join(self.directory.name, 'scenario.in')
+        self.binary_filename = os.path.join(self.directory.name, 'scenario.bin')
+        with open(self.json_filename, 'w', encoding='utf-8') as json_file:
+            json.dump(MARKET_CONFIG, json_file)
+        with open(self.binary_filename, 'wb') as binary_file:
+            binary_file.write(compile_scenario(MARKET_CONFIG))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_load(self):
+        """
+        Tests that a binary scenario loads to the same scenario as its `.in` file.
+        """
+        expected = load_json_config(self.json_filename)
+        scenario = BinaryScenario(self.binary_filename)
+        market_config = scenario.market_config()
+
+        self.assertEqual(market_config['marketplace'], expected['marketplace'])
+        self.assertEqual(market_config['product_ids'], expected['product_ids'])
+        self.assertEqual(materialize(market_config), materialize(expected))
+
+        # The lazy views decode single records and slices
+        carts = market_config['consumers'][0]['carts']
+        self.assertEqual(len(carts), 2)
+        self.assertEqual(carts[-1][0]['products'][1], carts[0][0]['product'])
+        self.assertEqual([op['type'] for op in carts[0][:]], ['add', 'remove'])
+        with self.assertRaises(IndexError):
+            _ = carts[2]
+
+    def test_header(self):
+        """
+        Tests that the files with another magic or version are rejected.
+        """
+        with open(self.binary_filename, 'rb') as binary_file:
+            data = bytearray(binary_file.read())
+
+        for magic, version in ((b'JUNK', VERSION), (MAGIC, VERSION + 1)):
+            struct.pack_into('<4sH', data, 0, magic, version)
+            with open(self.binary_filename, 'wb') as binary_file:
+                binary_file.write(data)
+            with self.assertRaises(ValueError):
+                BinaryScenario(self.binary_filename)
+
+        self.assertEqual(HEADER.unpack_from(data)[3], 8)